@@ -3,6 +3,7 @@ from __future__ import absolute_import, division, unicode_literals
 
 import io
 import multiprocessing
+import os
 import re
 import threading
 import time
@@ -12,12 +13,25 @@ from flask import jsonify
 from octoprint.events import Events
 
 from octoprint_ws281x_led_status import wizard
+from octoprint_ws281x_led_status.gcode import (
+    GcodeRule,
+    axis_position,
+    compile_rules,
+    parse_m150,
+    received_mode,
+)
+from octoprint_ws281x_led_status.gcode_index import GcodeIndex
+from octoprint_ws281x_led_status.mapping import MATRIX_ORIGINS
 from octoprint_ws281x_led_status.runner import (
     MODES,
+    PROCESS_SCHEDULERS,
     STRIP_SETTINGS,
     STRIP_TYPES,
+    TOOLHEAD_OFF_MSG,
+    TORCH_OFF_MSG,
     EffectRunner,
 )
+from octoprint_ws281x_led_status.temperature import HeatingModel, ProgressFilter
 
 from ._version import get_versions
 
@@ -36,6 +50,9 @@ OFF_AT_COMMAND = "WS_LIGHTSOFF"
 TORCH_AT_COMMAND = "WS_TORCH"
 TORCH_ON_AT_COMMAND = "WS_TORCH_ON"
 TORCH_OFF_AT_COMMAND = "WS_TORCH_OFF"
+TOOLHEAD_AXES = ["X", "Y"]
+PROGRESS_SOURCES = ["file", "z"]  # Position in the file (from OctoPrint), or height
+TOOLHEAD_DEFAULT_RANGE = (0, 200)  # mm, when the printer profile can't be read
 AT_COMMANDS = [
     ON_AT_COMMAND,
     OFF_AT_COMMAND,
@@ -57,6 +74,11 @@ STANDARD_EFFECT_NICE_NAMES = {
     "Blink": "blink",
     "Crossover": "cross",
     "Bouncy Balls": "balls",
+    "Comet": "comet",
+    "Scanner": "scanner",
+    "Trailing Wipe": "trail_wipe",
+    "Fire": "fire",
+    "Plasma": "plasma",
 }
 
 
@@ -84,6 +106,25 @@ class WS281xLedStatusPlugin(
         "startup"  # Used to put the old effect back on settings change/light switch
     )
     effect_queue = multiprocessing.Queue()  # pass name of effects here
+    stats_queue = multiprocessing.Queue()  # runner sends its timing stats back here
+    runner_stats = {}  # Latest stats from the runner, for the API
+    gcode_rules = {}  # Modes to switch to on gcode commands, see gcode.compile_rules
+    firmware_reaction = True  # React to errors & actions from the firmware
+
+    # Following the toolhead, see follow_toolhead
+    toolhead_axis = None  # Axis to follow, None when not following
+    toolhead_range = TOOLHEAD_DEFAULT_RANGE  # (min, max) position of the axis
+    toolhead_interval = 0.02  # secs, between sending positions to the runner
+    toolhead_due = 0  # time.time() the next position can be sent
+    toolhead_value = None  # Last position sent, as a percentage along the axis
+    toolhead_printing = False  # Only followed while printing, not eg. manual jogs
+    relative_positioning = False  # G91, positions in moves can't be followed
+
+    # Print progress from the height of the nozzle, see follow_z
+    progress_source = "file"  # From PROGRESS_SOURCES
+    print_path = None  # File being printed, on disk
+    max_z = None  # Height of the top layer of the print, None when not known (yet)
+    gcode_index = None  # gcode_index.GcodeIndex, made on startup
 
     SETTINGS = {}  # Filled in on startup
     PI_MODEL = None  # Filled in on startup
@@ -98,6 +139,9 @@ class WS281xLedStatusPlugin(
     target_temperature = {"tool": 0, "bed": 0}
     current_heater_heating = None
     tool_to_target = 0
+    # Smooths heating & cooling progress, so the effect only updates when it changes
+    temperature_filter = ProgressFilter()
+    heating_model = HeatingModel()  # Predicts heating time, for progress by time
 
     previous_event_q = (
         []
@@ -126,11 +170,28 @@ class WS281xLedStatusPlugin(
         )
         cfg_test_thread.daemon = True
         cfg_test_thread.start()
+        self.gcode_index = GcodeIndex(
+            os.path.join(self.get_plugin_data_folder(), "gcode_index"), self._logger
+        )
         self.refresh_settings()
 
     def on_after_startup(self):
+        stats_thread = threading.Thread(
+            target=self.receive_runner_stats, name="WS281X LED Status runner stats"
+        )
+        stats_thread.daemon = True
+        stats_thread.start()
+        prune_thread = threading.Thread(
+            target=self.gcode_index.prune, name="WS281X LED Status gcode index prune"
+        )
+        prune_thread.daemon = True
+        prune_thread.start()
         self.start_effect_process()
 
+    def receive_runner_stats(self):
+        while True:
+            self.runner_stats = self.stats_queue.get()
+
     # Shutdown plugin
     def on_shutdown(self):
         if self.current_effect_process is not None:
@@ -156,6 +217,15 @@ class WS281xLedStatusPlugin(
             "led_channel": 0,
             "strip_type": "WS2811_STRIP_GRB",
             "reverse": False,
+            "led_offset": 0,
+            "led_skip": "",
+            "serpentine_width": 0,
+            "matrix_enabled": False,
+            "matrix_width": 32,
+            "matrix_height": 8,
+            "matrix_serpentine": True,
+            "matrix_origin": "top_left",
+            "matrix_vertical": False,
             "startup_enabled": True,
             "startup_effect": "Color Wipe",
             "startup_color": "#00ff00",
@@ -184,6 +254,7 @@ class WS281xLedStatusPlugin(
             "progress_print_enabled": True,
             "progress_print_color_base": "#000000",
             "progress_print_color": "#00ff00",
+            "progress_print_source": "file",
             "printing_enabled": False,
             "printing_effect": "Solid Color",
             "printing_color": "#ffffff",
@@ -206,11 +277,33 @@ class WS281xLedStatusPlugin(
             "torch_delay": 1,
             "torch_timer": 15,
             "torch_toggle": False,
+            "toolhead_enabled": False,
+            "toolhead_color": "#ffffff",
+            "toolhead_color_base": "#000000",
+            "toolhead_axis": "X",
+            "toolhead_width": 5,
             "active_hours_enabled": False,
             "active_hours_start": "09:00",
             "active_hours_stop": "21:00",
             "at_command_reaction": True,
+            "firmware_reaction": True,
             "intercept_m150": True,
+            "transition_duration": 500,
+            "max_fps": 50,
+            "frame_rate_governor": True,
+            "balls_count": 2,
+            "balls_trail": 0,
+            "balls_rainbow": False,
+            "random_percent": 5,
+            "random_seed": "",
+            "process_nice": 0,
+            "process_cpus": "",
+            "process_scheduler": "normal",
+            "process_rt_priority": 10,
+            "overlay_opacity": 100,
+            "segments": [],
+            "outputs": [],
+            "gcode_rules": [],
         }
 
     # Template plugin
@@ -342,7 +435,11 @@ class WS281xLedStatusPlugin(
 
     def on_api_get(self, request=None):
         return jsonify(
-            lights_status=self.get_lights_status(), torch_status=self.get_torch_status()
+            lights_status=self.get_lights_status(),
+            torch_status=self.get_torch_status(),
+            runner_stats=self.runner_stats,
+            temperature_updates=self.temperature_filter.report(),
+            heating_remaining=self.heating_model.remaining if self.heating else None,
         )
 
     def activate_lights(self):
@@ -388,7 +485,7 @@ class WS281xLedStatusPlugin(
         )
         if self.torch_on:
             self.torch_on = False
-            self.update_effect(self.current_state)
+            self.update_effect(TORCH_OFF_MSG)
 
         self._send_UI_msg({"type": "torch", "on": False})
 
@@ -445,6 +542,10 @@ class WS281xLedStatusPlugin(
                 self.SETTINGS["strip"][setting] = self._settings.get_boolean([setting])
             elif setting == "strip_type":  # String settings
                 self.SETTINGS["strip"]["strip_type"] = self._settings.get([setting])
+            elif setting == "led_skip":  # Comma separated list of LED indexes
+                self.SETTINGS["strip"]["led_skip"] = self.parse_index_list(
+                    self._settings.get([setting])
+                )
             elif setting == "led_brightness":  # Percentage
                 self.SETTINGS["strip"]["led_brightness"] = min(
                     int(round((self._settings.get_int([setting]) / 100) * 255)), 255
@@ -470,8 +571,168 @@ class WS281xLedStatusPlugin(
                 )
             self.SETTINGS[mode] = mode_settings
 
+        # Segments are configured in config.yaml, as a list of
+        # {start: int, length: int, reverse: bool, modes: [mode names, empty for all]}
+        self.SETTINGS["segments"] = []
+        for segment in self._settings.get(["segments"]) or []:
+            try:
+                self.SETTINGS["segments"].append(
+                    {
+                        "start": int(segment["start"]),
+                        "length": int(segment["length"]),
+                        "reverse": bool(segment.get("reverse", False)),
+                        "modes": list(segment.get("modes") or []),
+                    }
+                )
+            except (KeyError, TypeError, ValueError, AttributeError):
+                self._logger.warning(
+                    "Segment configuration {} is invalid, ignoring it".format(segment)
+                )
+
+        # Extra strips, on the other PWM channel, are configured in config.yaml as a list of
+        # {led_count: int, led_pin: int, led_channel: int, strip_type: str, led_invert: bool}
+        # They follow on from the main strip, so segments can address them.
+        self.SETTINGS["outputs"] = []
+        for output in self._settings.get(["outputs"]) or []:
+            try:
+                strip_type = output.get(
+                    "strip_type", self.SETTINGS["strip"]["strip_type"]
+                )
+                if strip_type not in STRIP_TYPES:
+                    raise ValueError(strip_type)
+                self.SETTINGS["outputs"].append(
+                    {
+                        "led_count": int(output["led_count"]),
+                        "led_pin": int(output["led_pin"]),
+                        "led_channel": int(output["led_channel"]),
+                        "strip_type": strip_type,
+                        "led_invert": bool(output.get("led_invert", False)),
+                    }
+                )
+            except (KeyError, TypeError, ValueError, AttributeError):
+                self._logger.warning(
+                    "Output configuration {} is invalid, ignoring it".format(output)
+                )
+
+        matrix_origin = self._settings.get(["matrix_origin"])
+        self.SETTINGS["matrix"] = {
+            "enabled": self._settings.get_boolean(["matrix_enabled"]),
+            "width": max(self._settings.get_int(["matrix_width"]) or 1, 1),
+            "height": max(self._settings.get_int(["matrix_height"]) or 1, 1),
+            "serpentine": self._settings.get_boolean(["matrix_serpentine"]),
+            "origin": matrix_origin if matrix_origin in MATRIX_ORIGINS else "top_left",
+            "vertical": self._settings.get_boolean(["matrix_vertical"]),
+        }
+
+        self.SETTINGS["runner"] = {
+            "transition_duration": max(
+                self._settings.get_int(["transition_duration"]) or 0, 0
+            ),
+            "max_fps": min(max(self._settings.get_int(["max_fps"]) or 50, 1), 200),
+            "governor": self._settings.get_boolean(["frame_rate_governor"]),
+            "overlay_opacity": min(
+                max(self._settings.get_int(["overlay_opacity"]) or 0, 0), 100
+            ),
+        }
+
+        # Extra arguments for effects, by EFFECTS key
+        self.SETTINGS["effect_options"] = {
+            "balls": {
+                "ball_count": min(
+                    max(self._settings.get_int(["balls_count"]) or 1, 1), 50
+                ),
+                "trail": min(max(self._settings.get_int(["balls_trail"]) or 0, 0), 20),
+                "rainbow": self._settings.get_boolean(["balls_rainbow"]),
+            },
+            "toolhead": {
+                "width": min(
+                    max(self._settings.get_int(["toolhead_width"]) or 1, 1), 100
+                )
+            },
+            "random": {
+                "fraction": min(
+                    max(self._settings.get_int(["random_percent"]) or 1, 1), 100
+                )
+                / 100,
+                "seed": self._settings.get_int(["random_seed"]),  # None if blank
+            },
+        }
+
+        toolhead_axis = self._settings.get(["toolhead_axis"])
+        self.SETTINGS["toolhead"] = {
+            "enabled": self._settings.get_boolean(["toolhead_enabled"]),
+            "color": self._settings.get(["toolhead_color"]),
+            "base": self._settings.get(["toolhead_color_base"]),
+            "axis": toolhead_axis if toolhead_axis in TOOLHEAD_AXES else "X",
+        }
+        # Looked at for every move, so kept out of the settings lookups
+        self.toolhead_axis = (
+            self.SETTINGS["toolhead"]["axis"]
+            if self.SETTINGS["toolhead"]["enabled"]
+            else None
+        )
+        self.toolhead_interval = 1 / self.SETTINGS["runner"]["max_fps"]
+        self.toolhead_range = self.get_toolhead_range()
+
+        progress_source = self._settings.get(["progress_print_source"])
+        self.progress_source = (
+            progress_source if progress_source in PROGRESS_SOURCES else "file"
+        )
+
+        # Gcode rules are configured in config.yaml, as a list of
+        # {gcode: str, mode: mode name, parameters: str, eg. 'S1 T' - optional}
+        # Checked for every command sent, so compiled into a dict keyed on the gcode
+        rules = []
+        for rule in self._settings.get(["gcode_rules"]) or []:
+            try:
+                # Progress modes need a value, which a rule doesn't have
+                if rule["mode"] not in MODES or "progress" in rule["mode"]:
+                    raise ValueError(rule["mode"])
+                rules.append(
+                    (rule["gcode"], GcodeRule(rule["mode"], rule.get("parameters")))
+                )
+            except (KeyError, TypeError, ValueError, AttributeError):
+                self._logger.warning(
+                    "Gcode rule {} is invalid, ignoring it".format(rule)
+                )
+        self.gcode_rules = compile_rules(rules)
+        # Checked for every line received, so kept out of the settings lookups
+        self.firmware_reaction = self._settings.get_boolean(["firmware_reaction"])
+
+        # Applied to the effect process by the runner, see EffectRunner.apply_process_settings
+        scheduler = self._settings.get(["process_scheduler"])
+        self.SETTINGS["process"] = {
+            "nice": min(max(self._settings.get_int(["process_nice"]) or 0, 0), 19),
+            "cpus": self.parse_index_list(self._settings.get(["process_cpus"])),
+            "scheduler": scheduler if scheduler in PROCESS_SCHEDULERS else "normal",
+            "rt_priority": min(
+                max(self._settings.get_int(["process_rt_priority"]) or 1, 1), 99
+            ),
+        }
+
         self._logger.info("Settings refreshed")
 
+    def parse_index_list(self, value):
+        """
+        Parse a list of indexes (LEDs, CPU cores), entered as a string like '0, 5, 10-12'
+        :param value: string from the settings
+        :return: list of ints
+        """
+        indexes = []
+        for item in str(value or "").split(","):
+            item = item.strip()
+            if not item:
+                continue
+            try:
+                if "-" in item:
+                    first, last = item.split("-", 1)
+                    indexes.extend(range(int(first), int(last) + 1))
+                else:
+                    indexes.append(int(item))
+            except ValueError:
+                self._logger.warning("Invalid index {}, ignoring it".format(item))
+        return indexes
+
     def restart_strip(self):
         """
         Shortcut to restart the LED runner process.
@@ -498,6 +759,7 @@ class WS281xLedStatusPlugin(
                 self._settings.get_plugin_logfile_path(postfix="debug"),
                 self._settings.get_boolean(["debug_logging"]),
                 self.effect_queue,
+                self.stats_queue,
                 self.SETTINGS,
                 self.current_state,
             ),
@@ -509,6 +771,8 @@ class WS281xLedStatusPlugin(
             self.update_effect("on")
         else:
             self.update_effect("off")
+        if self.torch_on:
+            self.update_effect("torch")
 
     def stop_effect_process(self):
         """
@@ -528,26 +792,14 @@ class WS281xLedStatusPlugin(
         If progress effect, value must be specified
         :param mode_name: string of mode name
         :param value: percentage of how far through it is. None
+        :param m150: gcode.M150 to show, for the M150 mode
         """
         if self.return_timer is not None and self.return_timer.is_alive():
             self.return_timer.cancel()
 
-        if (
-            not self._settings.get_boolean(["torch_toggle"])
-            and mode_name != "torch"
-            and self.torch_on
-        ):
-            self.torch_on = False
-        else:
-            if mode_name != "torch" and self.torch_on:
-                # Catch all other effects while torch is on - except M150
-                if mode_name != "M150":
-                    if "progress" in mode_name:
-                        self.current_state = "{} {}".format(mode_name, value)
-                    else:
-                        self.current_state = mode_name
-
-        if mode_name in ["on", "off"]:
+        # Torch & M150 are drawn over the top of the other effects by the runner, so
+        # there is no need to keep track of what to put back when they finish.
+        if mode_name in ["on", "off", TORCH_OFF_MSG]:
             self.effect_queue.put(mode_name)
             return
         elif mode_name == "M150":
@@ -596,20 +848,53 @@ class WS281xLedStatusPlugin(
     def on_event(self, event, payload):
         if event == Events.PRINT_DONE:
             self.cooling = True
+            self.temperature_filter.reset(heating=False)
         elif event == Events.PRINT_STARTED:
             self.current_progress = 0
+            self.toolhead_range = self.get_toolhead_range()
+            self.toolhead_printing = True
+            self.relative_positioning = False
+            self.max_z = None
+            self.index_print(payload)
+        elif event == Events.UPLOAD:
+            self.index_upload(payload)
+        elif event == Events.FILE_REMOVED:
+            self.remove_index(payload.get("storage"), payload.get("path"))
+        elif event == Events.FILE_MOVED:
+            self.remove_index(payload.get("source_storage"), payload.get("source_path"))
         elif event == Events.PRINT_RESUMED:
             self.update_effect("progress_print", self.current_progress)
 
+        if event in [
+            Events.PRINT_DONE,
+            Events.PRINT_FAILED,
+            Events.PRINT_CANCELLED,
+            Events.DISCONNECTED,
+        ]:
+            self.toolhead_printing = False
+            if self.toolhead_axis:
+                self.effect_queue.put(TOOLHEAD_OFF_MSG)
+                self.toolhead_value = None
+        if event in [Events.PRINT_DONE, Events.PRINT_FAILED, Events.PRINT_CANCELLED]:
+            self.max_z = None
+
         if event in self.supported_events:
             self.update_effect(self.supported_events[event])
             # add all events to a backlog, so we know what the last one was.
             self.add_to_backlog(event)
 
     def on_print_progress(self, storage="", path="", progress=1):
+        if self.max_z:  # Following the height instead, see follow_z
+            return
+        self.show_print_progress(progress)
+
+    def show_print_progress(self, progress):
         if (progress == 100 and self.current_state == "success") or self.heating:
             return
-        if self._settings.get_boolean(["printing_enabled"]):
+        if self._settings.get_boolean(["printing_enabled"]) and not (
+            self.current_state.startswith(("printing", "progress_print"))
+        ):
+            # Printing effect sits underneath the progress bar, so only needs sending once
             self.update_effect("printing")
         self.update_effect("progress_print", progress)
         self.current_progress = progress
@@ -660,10 +945,23 @@ class WS281xLedStatusPlugin(
         *args,
         **kwargs
     ):
+        if gcode == "G1" or gcode == "G0":
+            if self.toolhead_axis and self.toolhead_printing:
+                self.follow_toolhead(cmd)
+            if self.max_z:
+                self.follow_z(cmd)
+        elif gcode == "G90" or gcode == "G91":
+            self.relative_positioning = gcode == "G91"
+
         if gcode in BLOCKING_TEMP_GCODES:
             bed_or_tool = {"M109": "tool", "M190": "bed"}
             # Everything is tracked, regardless of settings. Makes it easier to track the state, and then just back out
             # of showing the effect in self.update_effect() rather than getting complex here.
+            if not self.heating or self.current_heater_heating != bed_or_tool[gcode]:
+                self.temperature_filter.reset(heating=True)
+                self.heating_model.reset(
+                    time.time(), self.target_temperature[bed_or_tool[gcode]]
+                )
             self.heating = True
             self.current_heater_heating = bed_or_tool[gcode]
         else:
@@ -673,12 +971,171 @@ class WS281xLedStatusPlugin(
                 self.heating = False
                 self.process_previous_event_q()
                 if self._printer.is_printing():
-                    self.on_print_progress(progress=self.current_progress)
+                    self.show_print_progress(self.current_progress)
+
+        rules = self.gcode_rules.get(gcode)
+        if rules:
+            self.apply_gcode_rules(rules, cmd)
 
         if gcode == "M150" and self._settings.get_boolean(["intercept_m150"]):
-            self.update_effect("M150", m150=cmd)
+            # Parsed here, so the runner only has to show it
+            self.update_effect(
+                "M150",
+                m150=parse_m150(cmd, self.SETTINGS["strip"]["led_brightness"]),
+            )
             return (None,)
 
+    def follow_toolhead(self, cmd):
+        """
+        Send the runner where the toolhead is moving to, as a percentage along the axis.
+        Called on the comm thread for every move, so positions are only read & sent as
+        often as the runner can show them.
+        :param cmd: G0/G1 command
+        :return: None
+        """
+        now = time.time()
+        if now < self.toolhead_due or self.relative_positioning:
+            return
+        position = axis_position(cmd, self.toolhead_axis)
+        if position is None:  # Not moving this axis, try the next move
+            return
+        self.toolhead_due = now + self.toolhead_interval
+
+        low, high = self.toolhead_range
+        value = round(min(max((position - low) / (high - low), 0), 1) * 100, 1)
+        if value != self.toolhead_value:
+            # Straight to the queue, update_effect would cancel the return to idle timer
+            self.effect_queue.put("toolhead {}".format(value))
+            self.toolhead_value = value
+
+    def follow_z(self, cmd):
+        """
+        Show the print progress as the height of the nozzle, out of the height of the top
+        layer. Only ever goes up, so Z hops don't make it flicker.
+        :param cmd: G0/G1 command
+        :return: None
+        """
+        if self.relative_positioning or self.heating:
+            return
+        z = axis_position(cmd, "Z")
+        if z is None:
+            return
+        progress = int(min(z / self.max_z, 1) * 100)
+        if progress > self.current_progress:
+            self.show_print_progress(progress)
+
+    def index_upload(self, payload):
+        """
+        Index uploaded files straight away, in the background, so they are ready by the
+        time they are printed.
+        :param payload: UPLOAD event payload
+        :return: None
+        """
+        if payload.get("target") != "local":  # Files on the SD card can't be read
+            return
+        path = self.path_on_disk(payload.get("path"))
+        if path is not None:
+            self.gcode_index.index_in_background(path)
+
+    def index_print(self, payload):
+        """
+        Look up the index of the file being printed, eg. for the height of the top layer
+        to follow the height as progress. Files that weren't uploaded, or were changed
+        since, are indexed in the background, and until that's done progress comes from
+        OctoPrint as usual.
+        :param payload: PRINT_STARTED event payload
+        :return: None
+        """
+        if payload.get("origin") != "local":
+            return
+        path = self.path_on_disk(payload.get("path"))
+        self.print_path = path
+        if path is not None:
+            self.gcode_index.index_in_background(path, callback=self.on_print_indexed)
+
+    def on_print_indexed(self, index):
+        if index["path"] != self.print_path or not self._printer.is_printing():
+            return
+        if self.progress_source == "z" and index["max_z"] and index["max_z"] > 0:
+            self.max_z = index["max_z"]
+
+    def remove_index(self, storage, path):
+        """
+        Remove the index of a file that was deleted, or moved away
+        :param storage: where the file was, only 'local' files are indexed
+        :param path: path of the file, as in OctoPrint's events
+        :return: None
+        """
+        if storage != "local" or not path:
+            return
+        try:
+            path = self._file_manager.path_on_disk("local", path)
+        except (AttributeError, TypeError, ValueError):
+            return
+        self.gcode_index.remove(path)
+
+    def path_on_disk(self, path):
+        """
+        :param path: path of a local file, as in OctoPrint's events
+        :return: path to the file on disk, or None if it can't be found
+        """
+        try:
+            path = self._file_manager.path_on_disk("local", path)
+        except (AttributeError, TypeError, ValueError) as e:
+            self._logger.warning("Can't find the file {}: {}".format(path, e))
+            return None
+        if not os.path.isfile(path):
+            self._logger.warning("Can't find the file {}".format(path))
+            return None
+        return path
+
+    def get_toolhead_range(self):
+        """
+        :return: (min, max) position of the axis the toolhead is followed along, from the
+            printer profile
+        """
+        axis = self.toolhead_axis
+        if not axis:  # Not following the toolhead
+            return TOOLHEAD_DEFAULT_RANGE
+        try:
+            volume = self._printer_profile_manager.get_current_or_default()["volume"]
+            if volume.get("custom_box"):
+                box = volume["custom_box"]
+                low, high = box[axis.lower() + "_min"], box[axis.lower() + "_max"]
+            else:
+                size = volume["width"] if axis == "X" else volume["depth"]
+                low, high = (
+                    (-size / 2, size / 2) if volume["origin"] == "center" else (0, size)
+                )
+            if high > low:
+                return low, high
+        except (AttributeError, KeyError, TypeError):
+            pass
+        self._logger.warning(
+            "Couldn't read the {} axis size from the printer profile, using {}".format(
+                axis, TOOLHEAD_DEFAULT_RANGE
+            )
+        )
+        return TOOLHEAD_DEFAULT_RANGE
+
+    def apply_gcode_rules(self, rules, cmd):
+        """
+        Switch to the mode of the first rule the command matches
+        :param rules: list of gcode.GcodeRule for the command
+        :param cmd: full gcode command
+        :return: None
+        """
+        for rule in rules:
+            if rule.matches(cmd):
+                self._logger.debug(
+                    "Gcode rule matched {}, switching to {}".format(cmd, rule.mode)
+                )
+                if rule.mode == "torch":
+                    self.activate_torch()
+                else:
+                    self.update_effect(rule.mode)
+                return
+
     def temperatures_received(
         self, comm_instance, parsed_temperatures, *args, **kwargs
     ):
@@ -731,15 +1188,20 @@ class WS281xLedStatusPlugin(
                 self.process_previous_event_q()
                 return
 
-            self._logger.debug("State: heating, temp recv: {}".format(current_temp))
-            if self.target_temperature[self.current_heater_heating] > 0:
-                self.update_effect(
-                    "progress_heatup",
-                    self.calculate_heatup_progress(
-                        current_temp,
-                        self.target_temperature[self.current_heater_heating],
-                    ),
-                )
+            target = self.target_temperature[self.current_heater_heating]
+            if target > 0:
+                # Progress by time, as heating slows down the closer it gets
+                now = time.time()
+                self.heating_model.add(now, current_temp, target)
+                progress = self.heating_model.progress(now)
+                if progress is None:  # Can't predict yet, go by temperature until then
+                    progress = self.calculate_heatup_progress(current_temp, target)
+                progress = self.temperature_filter.update(progress)
+                if progress is not None:  # Only when there's a change to show
+                    self._logger.debug(
+                        "State: heating, temp recv: {}".format(current_temp)
+                    )
+                    self.update_effect("progress_heatup", progress)
 
         elif self.cooling:
             if self._printer.is_printing() or self._printer.is_paused():
@@ -750,24 +1212,35 @@ class WS281xLedStatusPlugin(
             current = parsed_temperatures[
                 words_to_tool[self._settings.get(["progress_cooling_bed_or_tool"])]
             ][0]
-            self._logger.debug("State: cooling, temp recv: {}".format(current))
-
             if current < self._settings.get_int(["progress_cooling_threshold"]):
                 self.cooling = False
                 self.process_previous_event_q()  # should hopefully put back the old effect (maybe progress)
                 return
-            self.update_effect(
-                "progress_cooling",
+            progress = self.temperature_filter.update(
                 self.calculate_heatup_progress(
                     current,
                     self.target_temperature[
                         self._settings.get(["progress_cooling_bed_or_tool"])
                     ],
-                ),
+                )
             )
+            if progress is not None:  # Only when there's a change to show
+                self._logger.debug("State: cooling, temp recv: {}".format(current))
+                self.update_effect("progress_cooling", progress)
 
         return parsed_temperatures
 
+    def process_gcode_received(self, comm_instance, line, *args, **kwargs):
+        mode = received_mode(line)  # Returns straight away for most lines
+        if mode is not None and self.firmware_reaction:
+            self._logger.debug(
+                "Received {} from the firmware, switching to {}".format(
+                    line.strip(), mode
+                )
+            )
+            self.update_effect(mode)
+        return line
+
     def process_at_command(
         self, comm, phase, command, parameters, tags=None, *args, **kwargs
     ):
@@ -861,6 +1334,7 @@ def __plugin_load__():
     __plugin_hooks__ = {
         "octoprint.plugin.softwareupdate.check_config": __plugin_implementation__.get_update_information,
         "octoprint.comm.protocol.gcode.queuing": __plugin_implementation__.process_gcode_q,
+        "octoprint.comm.protocol.gcode.received": __plugin_implementation__.process_gcode_received,
         "octoprint.comm.protocol.temperatures.received": __plugin_implementation__.temperatures_received,
         "octoprint.comm.protocol.atcommand.sending": __plugin_implementation__.process_at_command,
     }
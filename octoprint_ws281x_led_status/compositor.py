@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, unicode_literals
+
+from octoprint_ws281x_led_status.framebuffer import (
+    FrameBuffer,
+    blend_pixels,
+    scale_pixels,
+)
+
+OPAQUE = 256
+TRANSITION_FRAME_INTERVAL = 0.02  # secs, 50fps while blending between effects
+
+
+class Layer(object):
+    """
+    One effect, drawing into its own framebuffer. Layers are stacked by the Compositor
+    """
+
+    def __init__(self, name, num_pixels):
+        self.name = name
+        self.frame = FrameBuffer(num_pixels)
+        self.opacity = OPAQUE  # 0-256, how much of the layers below are covered
+        self.mode = (
+            None  # Message that started the effect, None when the layer is empty
+        )
+        self.effect = None  # Generator drawing into self.frame
+        self.restart_effect = None  # Creates the generator again when it completes
+        self.due = 0  # time.time() that the effect should draw its next frame
+        self.dirty = False  # Frame has changed since it was last composited
+
+    @property
+    def active(self):
+        return self.effect is not None
+
+    def start(self, mode, restart_effect):
+        self.mode = mode
+        self.restart_effect = restart_effect
+        self.frame.stop_tracking()
+        self.effect = restart_effect()
+        self.due = 0
+
+    def clear(self):
+        self.mode = self.effect = self.restart_effect = None
+
+    def render(self, now):
+        """Advance the effect by a frame, if it is due"""
+        if now < self.due:
+            return
+        try:
+            delay = next(self.effect)
+        except StopIteration:
+            # Effect completed a cycle, start it again
+            self.effect = self.restart_effect()
+            try:
+                delay = next(self.effect)
+            except StopIteration:
+                # Nothing to draw at all, eg. on too few pixels. Leave the layer blank
+                # rather than restarting it every frame.
+                self.frame.pixels[:] = [0] * len(self.frame.pixels)
+                self.due = float("inf")
+                self.dirty = True
+                return
+        self.due = now + (delay / 1000)
+        self.dirty = True
+
+
+class Compositor(object):
+    """
+    Keeps a stack of layers, and combines them into a single frame.
+    Layers hidden behind an opaque layer are not rendered, so their effect is paused
+    rather than restarted when they are uncovered. Only layers that have changed, and
+    those above them, are composited again.
+    """
+
+    def __init__(self, num_pixels, layer_names):
+        self.layers = [Layer(name, num_pixels) for name in layer_names]  # Bottom first
+        self.blank = [0] * num_pixels
+
+        self.pixels = self.blank  # Output of the last composite
+        self.brightness = 255
+        self.changed = (
+            None  # Pixels changed by the last composite, None for all of them
+        )
+        self.due = 0  # time.time() that the next visible layer wants to draw
+
+        self.restack = True  # Set when layers are started/cleared, forces a composite
+        self._composited = [self.blank] * len(layer_names)  # Output up to each layer
+
+    def layer(self, name):
+        for layer in self.layers:
+            if layer.name == name:
+                return layer
+        raise KeyError(name)
+
+    def start_layer(self, name, mode, restart_effect):
+        self.layer(name).start(mode, restart_effect)
+        self.restack = True
+
+    def clear_layer(self, name):
+        layer = self.layer(name)
+        if layer.active:
+            layer.clear()
+            self.restack = True
+
+    def covered(self, name):
+        """Whether the layer is hidden behind an active, opaque layer"""
+        for layer in reversed(self.layers):
+            if layer.name == name:
+                return False
+            if layer.active and layer.opacity >= OPAQUE:
+                return True
+        raise KeyError(name)
+
+    def visible_layers(self):
+        """Active layers, from the top down to the first opaque one. Returned bottom first"""
+        visible = []
+        for layer in reversed(self.layers):
+            if layer.active:
+                visible.append(layer)
+                if layer.opacity >= OPAQUE:
+                    break
+        visible.reverse()
+        return visible
+
+    def render(self, now):
+        """
+        Advance the visible layers, and composite them if anything changed
+        :param now: time.time() of this frame
+        :return: (bool) whether the output has changed
+        """
+        visible = self.visible_layers()
+        for layer in visible:
+            layer.render(now)
+        self.due = min(layer.due for layer in visible) if visible else float("inf")
+
+        first_dirty = 0 if self.restack else None
+        if first_dirty is None:
+            for i, layer in enumerate(visible):
+                if layer.dirty:
+                    first_dirty = i
+                    break
+            else:
+                return False
+        restacked = self.restack
+        self.restack = False
+        self.changed = None
+
+        if not visible:
+            self.pixels = self.blank
+            self.brightness = 255
+            return True
+
+        if len(visible) == 1 and visible[0].opacity >= OPAQUE:
+            # Nothing to blend, the strip can apply the brightness itself
+            frame = visible[0].frame
+            visible[0].dirty = False
+            changed = frame.take_changes()
+            if not restacked and self.pixels is frame.pixels:
+                # Only the pixels the effect changed need to be sent to the strip
+                self.changed = changed
+            self.pixels = frame.pixels
+            self.brightness = frame.brightness
+            return True
+
+        for i in range(first_dirty, len(visible)):
+            layer = visible[i]
+            below = self._composited[i - 1] if i > 0 else self.blank
+            if layer.opacity >= OPAQUE:
+                self._composited[i] = layer.frame.scaled()
+            else:
+                self._composited[i] = blend_pixels(
+                    below, layer.frame.scaled(), layer.opacity
+                )
+            layer.frame.take_changes()  # Whole frame is composited anyway
+            layer.dirty = False
+
+        self.pixels = self._composited[len(visible) - 1]
+        self.brightness = 255
+        return True
+
+
+class Segment(object):
+    """
+    A range of the strip, with its own stack of layers showing some (or all) of the modes.
+    Handles fading between effects within the segment.
+    """
+
+    def __init__(
+        self,
+        start,
+        length,
+        layer_names,
+        reverse=False,
+        modes=None,
+        transition_duration=0,
+    ):
+        self.start = start
+        self.length = length
+        self.reverse = reverse
+        self.modes = modes  # Mode names shown on this segment, None for all
+        self.compositor = Compositor(length, layer_names)
+
+        self.pixels = self.compositor.blank  # Output of the last frame
+        self.brightness = 255
+        self.changed = None  # Pixels changed in the last frame, None for all of them
+        self.due = 0  # time.time() that the segment wants to draw again
+
+        self.transition_duration = transition_duration  # secs, 0 disables
+        self.transition_start = None
+        self.transition_from = None  # Frame that was shown when the fade started
+
+    def shows(self, mode):
+        return not self.modes or mode in self.modes
+
+    def start_transition(self, now):
+        if self.transition_duration > 0:
+            # Start from what is shown now, which may be part way through another transition
+            self.transition_from = scale_pixels(self.pixels, self.brightness)
+            self.transition_start = now
+
+    def cancel_transition(self):
+        self.transition_start = self.transition_from = None
+
+    def render(self, now, active=True):
+        """
+        Advance the layers & any transition, setting self.pixels and self.brightness
+        :param now: time.time() of this frame
+        :param active: (bool) False to show nothing, eg. the lights are off
+        :return: (bool) whether the output has changed
+        """
+        self.changed = None
+        if active:
+            changed = self.compositor.render(now)
+            pixels = self.compositor.pixels
+            brightness = self.compositor.brightness
+            due = self.compositor.due
+        else:
+            changed = False
+            pixels = self.compositor.blank
+            brightness = 255
+            due = float("inf")
+
+        if self.transition_start is not None:
+            elapsed = now - self.transition_start
+            if elapsed < self.transition_duration:
+                weight = int(OPAQUE * elapsed / self.transition_duration)
+                self.pixels = blend_pixels(
+                    self.transition_from, scale_pixels(pixels, brightness), weight
+                )
+                self.brightness = 255
+                self.due = min(due, now + TRANSITION_FRAME_INTERVAL)
+                return True
+            # Transition is done, make sure the final frame is shown as-is
+            self.cancel_transition()
+            changed = True
+
+        if self.pixels is not pixels or self.brightness != brightness:
+            changed = True
+        elif changed:
+            self.changed = self.compositor.changed
+        self.pixels = pixels
+        self.brightness = brightness
+        self.due = due
+        return changed
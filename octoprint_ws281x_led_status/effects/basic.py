@@ -4,64 +4,116 @@ from __future__ import absolute_import, division, unicode_literals
 import math
 import random
 import time
+from collections import deque
 
-from octoprint_ws281x_led_status.util import q_poll_milli_sleep, q_poll_sleep, wheel
+from octoprint_ws281x_led_status.framebuffer import pack_rgb, scale_pixels
+from octoprint_ws281x_led_status.util import wheel
 
 DIRECTIONS = [
     "forward",
     "backward",
 ]  # Used for effects that go 'out and back' kind of thing
 
+# Effects are generators, drawing into a framebuffer.FrameBuffer. Each `yield` completes a
+# frame, and gives the time in ms until the next frame should be drawn. The runner takes
+# care of showing the frame, and of stopping the effect when the mode changes.
 
-def solid_color(
-    strip, queue, color, delay=None, max_brightness=255, set_brightness=True, wait=True
-):
+# Colours are packed once when the effect starts, and drawn with setPixelColor, so frames
+# don't create a tuple for every pixel. Effects that only move a few pixels around draw
+# with strip.mark() instead, so only those pixels are sent to the strip, and each frame
+# costs the same however long the strip is.
+
+# Effects moving along the strip take `delay * CYCLE_STEPS` ms per pass, so they take
+# the same time on a long strip as on the default 24 LED one.
+CYCLE_STEPS = 24
+
+WHEEL = [pack_rgb(*wheel(pos)) for pos in range(256)]  # Packed util.wheel colours
+
+COPY_INTERVAL = 60000  # ms, copy_frame is redrawn on demand rather than on a timer
+
+
+def fill(strip, color):
+    """Set every pixel to a packed colour"""
+    strip.pixels[:] = [color] * strip.numPixels()
+
+
+def copy_frame(strip, source, start=0, reverse=False):
+    """
+    Show part of another framebuffer, eg. the one M150 commands draw into. The source
+    doesn't change by itself, so this only draws again when the runner makes it due.
+    :param source: framebuffer.FrameBuffer to copy from
+    :param start: index of the first pixel to copy
+    :param reverse: (bool) copy the pixels backwards
+    """
+    end = start + strip.numPixels()
+    while True:
+        pixels = source.pixels[start:end]
+        strip.pixels[:] = pixels[::-1] if reverse else pixels
+        strip.setBrightness(source.brightness)
+        yield COPY_INTERVAL
+
+
+def timed_steps(steps, duration):
+    """
+    Spread steps evenly across a duration, working out the step from the time elapsed.
+    When frames are shown less often than the steps, the steps in between are skipped.
+    :param steps: number of steps, eg. pixels to move through
+    :param duration: ms to take over all the steps
+    :return: generator of (step, ms until the next step is due)
+    """
+    if steps <= 0:
+        return
+    step_time = duration / steps / 1000
+    if step_time <= 0:  # eg. a delay of 0, one step every frame
+        for step in range(steps):
+            yield step, 0
+        return
+    start = time.time()
+    step = 0
+    while step < steps:
+        now = time.time()
+        yield step, max((start + (step + 1) * step_time - now) * 1000, 0)
+        # Always finish on the last step, so it isn't skipped
+        step = max(step + 1, min(int((time.time() - start) / step_time), steps - 1))
+
+
+def solid_color(strip, color, delay=None, max_brightness=255):
     # Set pixels to a solid color
-    if set_brightness:
-        strip.setBrightness(max_brightness)
-    for p in range(strip.numPixels()):
-        strip.setPixelColorRGB(p, *color)
-    strip.show()
-    if wait:
-        if not q_poll_sleep(0.1, queue):
-            return
+    strip.setBrightness(max_brightness)
+    fill(strip, pack_rgb(*color))
+    yield 100
 
 
-def color_wipe(strip, queue, color, delay, max_brightness=255):
+def color_wipe(strip, color, delay, max_brightness=255):
     strip.setBrightness(max_brightness)
-    for i in range(strip.numPixels()):
-        strip.setPixelColorRGB(i, *color)
-        strip.show()
-        if not q_poll_milli_sleep(delay, queue):
-            return
-    for i in range(strip.numPixels()):
-        strip.setPixelColorRGB(i, 0, 0, 0)
-        strip.show()
-        if not q_poll_milli_sleep(delay, queue):
-            return
-
-
-def color_wipe_2(strip, queue, color, delay, max_brightness=255):
+    num_pixels = strip.numPixels()
+    for wipe_color in [pack_rgb(*color), 0]:
+        drawn = 0
+        for i, wait in timed_steps(num_pixels, delay * CYCLE_STEPS):
+            for p in range(drawn, i + 1):
+                strip.setPixelColor(p, wipe_color)
+            drawn = i + 1
+            yield wait
+
+
+def color_wipe_2(strip, color, delay, max_brightness=255):
     strip.setBrightness(max_brightness)
+    num_pixels = strip.numPixels()
+    packed = pack_rgb(*color)
     for direction in DIRECTIONS:
-        for i in (
-            range(strip.numPixels())
-            if direction == "forward"
-            else reversed(range(strip.numPixels()))
-        ):
-            if direction == "backward":
-                color = (0, 0, 0)
-            strip.setPixelColorRGB(i, *color)
-            strip.show()
-            if not q_poll_milli_sleep(delay, queue):
-                return
-
-
-def simple_pulse(strip, queue, color, delay, max_brightness=255):
-    strip.setBrightness(1)
-    solid_color(
-        strip, queue, color, delay, max_brightness, set_brightness=False, wait=False
-    )
+        drawn = 0
+        for i, wait in timed_steps(num_pixels, delay * CYCLE_STEPS):
+            for p in range(drawn, i + 1):
+                if direction == "forward":
+                    strip.setPixelColor(p, packed)
+                else:
+                    strip.setPixelColor(num_pixels - 1 - p, 0)
+            drawn = i + 1
+            yield wait
+
+
+def simple_pulse(strip, color, delay, max_brightness=255):
+    fill(strip, pack_rgb(*color))
     for direction in DIRECTIONS:
         for b in (
             range(max_brightness)
@@ -69,188 +121,180 @@ def simple_pulse(strip, queue, color, delay, max_brightness=255):
             else reversed(range(max_brightness))
         ):
             strip.setBrightness(b)
-            strip.show()
-            if not q_poll_milli_sleep(delay, queue):
-                return
+            yield delay
 
 
-def rainbow(strip, queue, color, delay, max_brightness=255):
+def rainbow(strip, color, delay, max_brightness=255):
     strip.setBrightness(max_brightness)
     for i in range(256):
-        solid_color(
-            strip,
-            queue,
-            wheel(i),
-            delay,
-            max_brightness,
-            set_brightness=False,
-            wait=False,
-        )
-        if not q_poll_milli_sleep(delay, queue):
-            return
+        fill(strip, WHEEL[i])
+        yield delay
 
 
-def rainbow_cycle(strip, queue, color, delay, max_brightness=255):
+def rainbow_cycle(strip, color, delay, max_brightness=255):
     strip.setBrightness(max_brightness)
+    num_pixels = strip.numPixels()
+    pixels = strip.pixels
+    hues = [int(i * 256 / num_pixels) for i in range(num_pixels)]
     for j in range(256):
-        for i in range(strip.numPixels()):
-            strip.setPixelColorRGB(
-                i, *wheel((int(i * 256 / strip.numPixels()) + j) & 255)
-            )
-        strip.show()
-        if not q_poll_milli_sleep(delay, queue):
-            return
+        for i in range(num_pixels):
+            pixels[i] = WHEEL[(hues[i] + j) & 255]
+        yield delay
 
 
-def solo_bounce(strip, queue, color, delay, max_brightness=255):
+def solo_bounce(strip, color, delay, max_brightness=255):
     strip.setBrightness(max_brightness)
+    num_pixels = strip.numPixels()
+    packed = pack_rgb(*color)
+    fill(strip, 0)
+    strip.track_changes()
+    previous = 0
     for direction in DIRECTIONS:
-        for i in (
-            range(strip.numPixels())
-            if direction == "forward"
-            else reversed(range(strip.numPixels()))
-        ):
-            strip.setPixelColorRGB(i, *color)
-            for blank in range(strip.numPixels()):
-                if blank != i:
-                    strip.setPixelColorRGB(blank, 0, 0, 0)
-            strip.show()
-            if not q_poll_milli_sleep(delay, queue):
-                return
+        for step, wait in timed_steps(num_pixels, delay * CYCLE_STEPS):
+            i = step if direction == "forward" else num_pixels - 1 - step
+            strip.mark(previous, 0)
+            strip.mark(i, packed)
+            previous = i
+            yield wait
 
 
-def bounce(strip, queue, color, delay, max_brightness=255):
+def bounce(strip, color, delay, max_brightness=255):
     red, green, blue = color
-    size = 3
+    num_pixels = strip.numPixels()
+    size = max(
+        min(3, num_pixels - 3), 1
+    )  # Smaller on short strips, to leave room to move
+    # The ends of the bar are dimmer
+    body = [pack_rgb(red, green, blue)] * size
+    tail = pack_rgb(
+        int(math.floor(red / 10)),
+        int(math.floor(green / 10)),
+        int(math.floor(blue / 10)),
+    )
+    strip.setBrightness(max_brightness)
+    travel = num_pixels - size - 2
+    if travel <= 0:  # No room to move at all, show the bar on its own
+        fill(strip, body[0])
+        yield 100
+        return
     for direction in DIRECTIONS:
-        for i in (
-            range(0, (strip.numPixels() - size - 2))
-            if direction == "forward"
-            else range((strip.numPixels() - size - 2), 0, -1)
-        ):
-            solid_color(
-                strip, queue, (0, 0, 0), max_brightness=max_brightness, wait=False
-            )
-            strip.setPixelColorRGB(
-                i,
-                *(
-                    int(math.floor(red / 10)),
-                    int(math.floor(green / 10)),
-                    int(math.floor(blue / 10)),
-                )
-            )
-            for j in range(1, (size + 1)):
-                strip.setPixelColorRGB(i + j, *(red, green, blue))
-            strip.setPixelColorRGB(
-                i + size + 1,
-                *(
-                    int(math.floor(red / 10)),
-                    int(math.floor(green / 10)),
-                    int(math.floor(blue / 10)),
-                )
-            )
-            strip.show()
-            if not q_poll_milli_sleep(delay, queue):
-                return
-
-
-def random_single(strip, queue, color, delay, max_brightness=255):
+        for step, wait in timed_steps(travel, delay * CYCLE_STEPS):
+            i = step if direction == "forward" else travel - step
+            fill(strip, 0)
+            strip.setPixelColor(i, tail)
+            strip.pixels[i + 1 : i + size + 1] = body
+            strip.setPixelColor(i + size + 1, tail)
+            yield wait
+
+
+def random_single(strip, color, delay, max_brightness=255, fraction=0.05, seed=None):
+    """
+    :param fraction: share of the pixels to change each frame, at least one is
+    :param seed: seed for the random numbers, so the same sparkles can be repeated.
+        None for different ones every time.
+    """
+    rng = random.Random(seed)
+    randrange = rng.randrange
+    random_hue = rng.getrandbits
     strip.setBrightness(max_brightness)
-    for p in range(strip.numPixels()):
-        strip.setPixelColorRGB(p, *wheel(random.randint(0, 255)))
-    strip.show()
+    num_pixels = strip.numPixels()
+    for p in range(num_pixels):
+        strip.setPixelColor(p, WHEEL[random_hue(8)])
+    strip.track_changes()
+    yield delay
+    per_frame = max(int(round(num_pixels * fraction)), 1)
     while True:
-        strip.setPixelColorRGB(
-            random.randint(0, strip.numPixels()), *wheel(random.randint(0, 255))
-        )
-        strip.show()
-        if not q_poll_milli_sleep(delay, queue):
-            return
+        for _ in range(per_frame):
+            strip.mark(randrange(num_pixels), WHEEL[random_hue(8)])
+        yield delay
 
 
-def blink(strip, queue, color, delay, max_brightness=255):
-    solid_color(strip, queue, color, delay, max_brightness, wait=False)
+def blink(strip, color, delay, max_brightness=255):
+    fill(strip, pack_rgb(*color))
     for direction in DIRECTIONS:
         strip.setBrightness(max_brightness if direction == "forward" else 0)
-        strip.show()
-        for ms in range(
-            int(delay / 2)
-        ):  # We do it this way so we can check the q more often, as for blink
-            if not q_poll_milli_sleep(
-                2, queue
-            ):  # delay may be high. Otherwise the effect may end up blocking the
-                return  # server, when settings are saved, or it shuts down.
+        yield delay
 
 
-def crossover(strip, queue, color, delay, max_brightness=255):
+def crossover(strip, color, delay, max_brightness=255):
     strip.setBrightness(max_brightness)
-    solid_color(strip, queue, (0, 0, 0), wait=False)
+    fill(strip, 0)
+    strip.track_changes()
+    packed = pack_rgb(*color)
     num_pixels = strip.numPixels()
     if num_pixels % 2 != 1:
         num_pixels -= 1
 
-    for i in range(num_pixels):
-        for p in range(num_pixels):
-            strip.setPixelColorRGB(p, 0, 0, 0)
-        strip.setPixelColorRGB(i, *color)
-        strip.setPixelColorRGB(num_pixels - 1 - i, *color)
-        strip.show()
-        if not q_poll_milli_sleep(delay, queue):
-            return
+    previous = 0
+    for i, wait in timed_steps(num_pixels, delay * CYCLE_STEPS):
+        strip.mark(previous, 0)
+        strip.mark(num_pixels - 1 - previous, 0)
+        strip.mark(i, packed)
+        strip.mark(num_pixels - 1 - i, packed)
+        previous = i
+        yield wait
 
 
 # Credit to https://www.tweaking4all.com/hardware/arduino/adruino-led-strip-effects/#LEDStripEffectBouncingBalls
 # Translated from c++ to Python by me
-def bouncy_balls(strip, queue, color, delay, max_brightness=255):
+def bouncy_balls(
+    strip, color, delay, max_brightness=255, ball_count=2, trail=0, rainbow=False
+):
+    """
+    :param ball_count: number of balls to bounce
+    :param trail: number of frames each ball leaves a fading trail for
+    :param rainbow: (bool) give each ball its own colour, spread around the colour wheel
+    """
     strip.setBrightness(max_brightness)
-    ball_count = 2
+    fill(strip, 0)
+    strip.track_changes()
+    num_pixels = strip.numPixels()
     gravity = -9.81
     start_height = 1
-
-    height = []
     impact_velocity_start = math.sqrt(-2 * gravity * start_height)
-    impact_velocity = []
-    time_since_last_bounce = []
-    position = []
-    clock_time_since_last_bounce = []
-    dampening = []
-
-    for i in range(ball_count):
-        clock_time_since_last_bounce.append(time.time() * 1000)
-        time_since_last_bounce.append(0)
-        height.append(start_height)
-        position.append(0)
-        impact_velocity.append(impact_velocity_start)
-        dampening.append(0.9 - (i / math.pow(ball_count, 2)))
+    balls = range(ball_count)
+
+    # Colours for each ball, from the ball itself to the end of its trail
+    colors = []
+    for i in balls:
+        head = WHEEL[int(i * 256 / ball_count)] if rainbow else pack_rgb(*color)
+        colors.append(
+            [
+                scale_pixels([head], int(255 * (trail + 1 - t) / (trail + 1)))[0]
+                for t in range(trail + 1)
+            ]
+        )
+    # Positions of each ball over the last frames, newest first
+    history = [deque([0], maxlen=trail + 1) for _ in balls]
 
-    while True:
-        for i in range(ball_count):
-            time_since_last_bounce[i] = (
-                time.time() * 1000 - clock_time_since_last_bounce[i]
-            )
-            height[i] = (
-                0.5 * gravity * math.pow(time_since_last_bounce[i] / 1000, 2)
-                + impact_velocity[i] * time_since_last_bounce[i] / 1000
-            )
-
-            if height[i] < 0:
-                height[i] = 0
-                impact_velocity[i] = dampening[i] * impact_velocity[i]
-                clock_time_since_last_bounce[i] = time.time() * 1000
+    now = time.time()
+    last_bounce = [now] * ball_count
+    impact_velocity = [impact_velocity_start] * ball_count
+    dampening = [0.9 - (i / math.pow(ball_count, 2)) for i in balls]
+    scale = (num_pixels - 1) / start_height
 
+    while True:
+        now = time.time()  # Same time for every ball, so they are drawn in step
+        for positions in history:
+            # Blank where the ball was, before lighting where it is now
+            for p in positions:
+                strip.mark(p, 0)
+
+        for i in balls:
+            elapsed = now - last_bounce[i]
+            height = 0.5 * gravity * elapsed * elapsed + impact_velocity[i] * elapsed
+            if height < 0:
+                height = 0
+                impact_velocity[i] *= dampening[i]
+                last_bounce[i] = now
                 if impact_velocity[i] < 0.01:
                     impact_velocity[i] = impact_velocity_start
+            history[i].appendleft(int(round(height * scale)))
 
-            position[i] = int(round(height[i] * (strip.numPixels() - 1) / start_height))
-
-        for p in range(strip.numPixels()):
-            # Set to blank
-            strip.setPixelColorRGB(p, 0, 0, 0)
-
-        for i in range(ball_count):
-            # Light pixels that should be lit
-            strip.setPixelColorRGB(position[i], *color)
+        # Ends of the trails first, so the balls are drawn over them
+        for t in reversed(range(trail + 1)):
+            for i in balls:
+                if t < len(history[i]):
+                    strip.mark(history[i][t], colors[i][t])
 
-        strip.show()
-        if not q_poll_milli_sleep(delay, queue):
-            return
+        yield delay
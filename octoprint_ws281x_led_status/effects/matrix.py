@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+# Versions of the effects for LED matrices, that make use of both dimensions
+from __future__ import absolute_import, division, unicode_literals
+
+from octoprint_ws281x_led_status.effects.basic import CYCLE_STEPS, WHEEL, timed_steps
+from octoprint_ws281x_led_status.framebuffer import pack_rgb
+from octoprint_ws281x_led_status.util import blend_two_colors
+
+# Matrix effects take the same arguments as the strip versions, plus the width of the
+# matrix. Pixels are drawn a row at a time from the top left (see mapping.matrix_order),
+# so a rectangle is filled with one slice assignment per row, rather than pixel by pixel.
+
+
+class Matrix(object):
+    """2D view of a framebuffer.FrameBuffer, for effects to draw on"""
+
+    def __init__(self, strip, width):
+        self.pixels = strip.pixels
+        self.width = width
+        self.height = len(self.pixels) // width
+
+    def fill_rect(self, x, y, width, height, color):
+        """
+        Fill a rectangle with a packed colour
+        :param x: column of the left edge
+        :param y: row of the top edge
+        :param width: number of columns
+        :param height: number of rows
+        :param color: packed pixel
+        """
+        if width <= 0:
+            return
+        line = [color] * width
+        for row in range(y, y + height):
+            start = row * self.width + x
+            self.pixels[start : start + width] = line
+
+    def fill_columns(self, x, count, color):
+        self.fill_rect(x, 0, count, self.height, color)
+
+    def fill_rows_with(self, line):
+        """Copy a row of packed pixels onto every row"""
+        for row in range(self.height):
+            start = row * self.width
+            self.pixels[start : start + self.width] = line
+
+
+def progress(strip, value, progress_color, base_color, max_brightness=255, width=1):
+    """
+    Fills whole columns from left to right, with the current column filling from the
+    bottom up, so there are width * height steps
+    """
+    strip.setBrightness(max_brightness)
+    matrix = Matrix(strip, width)
+    value = min(max(value, 0), 100)
+    steps = (value / 100) * matrix.width * matrix.height
+    whole_columns, column_steps = divmod(steps, matrix.height)
+    whole_columns = int(whole_columns)
+    lit_rows = int(column_steps)
+
+    matrix.fill_columns(0, whole_columns, pack_rgb(*progress_color))
+    matrix.fill_columns(
+        whole_columns, matrix.width - whole_columns, pack_rgb(*base_color)
+    )
+    if whole_columns < matrix.width:
+        # Current column, filling up from the bottom row
+        for row in range(matrix.height - lit_rows, matrix.height):
+            strip.setPixelColorRGB(row * width + whole_columns, *progress_color)
+        remainder = column_steps - lit_rows
+        if remainder > 0.0:
+            strip.setPixelColorRGB(
+                (matrix.height - lit_rows - 1) * width + whole_columns,
+                *blend_two_colors(progress_color, base_color, remainder)
+            )
+    yield 100
+
+
+def color_wipe(strip, color, delay, max_brightness=255, width=1):
+    strip.setBrightness(max_brightness)
+    matrix = Matrix(strip, width)
+    for packed in [pack_rgb(*color), 0]:
+        drawn = 0
+        for x, wait in timed_steps(matrix.width, delay * CYCLE_STEPS):
+            matrix.fill_columns(drawn, x + 1 - drawn, packed)
+            drawn = x + 1
+            yield wait
+
+
+def color_wipe_2(strip, color, delay, max_brightness=255, width=1):
+    strip.setBrightness(max_brightness)
+    matrix = Matrix(strip, width)
+    for packed in [pack_rgb(*color), 0]:
+        drawn = 0
+        for x, wait in timed_steps(matrix.width, delay * CYCLE_STEPS):
+            if packed:
+                matrix.fill_columns(drawn, x + 1 - drawn, packed)
+            else:  # Going back the other way
+                matrix.fill_columns(matrix.width - 1 - x, x + 1 - drawn, packed)
+            drawn = x + 1
+            yield wait
+
+
+def rainbow_cycle(strip, color, delay, max_brightness=255, width=1):
+    strip.setBrightness(max_brightness)
+    matrix = Matrix(strip, width)
+    hues = [int(x * 256 / matrix.width) for x in range(matrix.width)]
+    line = [0] * matrix.width
+    for j in range(256):
+        for x in range(matrix.width):
+            line[x] = WHEEL[(hues[x] + j) & 255]
+        matrix.fill_rows_with(line)
+        yield delay
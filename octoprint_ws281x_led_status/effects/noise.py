@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+# Ambient effects, driven by smooth noise
+from __future__ import absolute_import, division, unicode_literals
+
+import random
+import time
+
+from octoprint_ws281x_led_status.effects.basic import WHEEL
+from octoprint_ws281x_led_status.framebuffer import pack_rgb
+
+# The noise is worked out once, into a looping table of 0-255 values. Each pixel reads
+# the table at its own offset, and the offsets move with time, so a frame is only table
+# lookups - no per-pixel noise maths.
+_rng = random.Random(1)  # Fixed seed, so the effects look the same every time
+PERMUTATION = list(range(256))
+_rng.shuffle(PERMUTATION)
+PERMUTATION += PERMUTATION  # Saves wrapping the index when looking up the next cell
+GRADIENTS = [_rng.uniform(-1, 1) for _ in range(256)]
+
+SAMPLES_PER_CELL = 8
+NOISE_SIZE = 256 * SAMPLES_PER_CELL  # Power of two, so indexes wrap with NOISE_MASK
+NOISE_MASK = NOISE_SIZE - 1
+
+FRAME_INTERVAL = 20  # ms
+
+
+def gradient_noise(x):
+    """1D gradient (Perlin) noise, repeating every 256. Roughly -0.5 to 0.5"""
+    cell = int(x)
+    t = x - cell
+    index = cell & 255
+    start = GRADIENTS[PERMUTATION[index]] * t
+    end = GRADIENTS[PERMUTATION[index + 1]] * (t - 1)
+    fade = t * t * t * (t * (t * 6 - 15) + 10)
+    return start + fade * (end - start)
+
+
+def _noise_table():
+    samples = [gradient_noise(n / SAMPLES_PER_CELL) for n in range(NOISE_SIZE)]
+    low = min(samples)
+    scale = 255 / (max(samples) - low)
+    return [int((sample - low) * scale) for sample in samples]
+
+
+NOISE = _noise_table()
+
+
+def _blend(start, end, weight):
+    """Blend two r, g, b tuples, weight 0-255, into a packed colour"""
+    return pack_rgb(*(int(a + (b - a) * weight / 255) for a, b in zip(start, end)))
+
+
+def fire(strip, color, delay, max_brightness=255):
+    """
+    Flickering flames, rising from the start of the strip. The flames are `color` in the
+    middle, black when cool and white when hottest.
+    """
+    strip.setBrightness(max_brightness)
+    num_pixels = strip.numPixels()
+    palette = [_blend((0, 0, 0), color, heat * 2) for heat in range(128)] + [
+        _blend(color, (255, 255, 255), (heat - 128) * 2) for heat in range(128, 256)
+    ]
+    # For each pixel: offsets into the noise for the slow flames & the fast flicker, and
+    # how much of the heat reaches that high up (0-256)
+    pixels = [
+        (
+            p * 3,
+            p * 5 + NOISE_SIZE // 2,
+            int(256 * (1 - p / num_pixels) ** 0.5),
+        )
+        for p in range(num_pixels)
+    ]
+    delay = max(delay, 1)  # ms, 0 would move infinitely fast
+    start = time.time()
+    while True:
+        elapsed = (time.time() - start) * 1000 / delay
+        rise = int(elapsed * 4)
+        flicker = int(elapsed * 9)
+        strip.pixels[:] = [
+            palette[
+                (
+                    NOISE[(slow - rise) & NOISE_MASK]
+                    + NOISE[(fast - flicker) & NOISE_MASK]
+                )
+                * height
+                >> 9
+            ]
+            for slow, fast, height in pixels
+        ]
+        yield FRAME_INTERVAL
+
+
+def plasma(strip, color, delay, max_brightness=255):
+    """Slowly shifting rainbow blobs, from two layers of noise drifting past each other"""
+    strip.setBrightness(max_brightness)
+    num_pixels = strip.numPixels()
+    pixels = [(p * 2, p * 3 + NOISE_SIZE // 3) for p in range(num_pixels)]
+    delay = max(delay, 1)  # ms, 0 would move infinitely fast
+    start = time.time()
+    while True:
+        elapsed = (time.time() - start) * 1000 / delay
+        drift = int(elapsed * 2)
+        strip.pixels[:] = [
+            WHEEL[
+                (NOISE[(a + drift) & NOISE_MASK] + NOISE[(b - drift) & NOISE_MASK])
+                & 255
+            ]
+            for a, b in pixels
+        ]
+        yield FRAME_INTERVAL
@@ -3,35 +3,38 @@
 from __future__ import absolute_import, division, unicode_literals
 
 import math
-import time
 
-from octoprint_ws281x_led_status.util import blend_two_colors, q_poll_sleep
+from octoprint_ws281x_led_status.effects.basic import fill
+from octoprint_ws281x_led_status.framebuffer import pack_rgb
+from octoprint_ws281x_led_status.util import blend_two_colors
 
 
-def progress(
-    strip, queue, value, progress_color, base_color, max_brightness=255, reverse=False
-):
+def progress(strip, value, progress_color, base_color, max_brightness=255):
     strip.setBrightness(max_brightness)
     num_pixels = strip.numPixels()
+    value = min(max(value, 0), 100)  # eg. cooling starts a little over the target
     upper_bar = (value / 100) * num_pixels
     upper_remainder, upper_whole = math.modf(upper_bar)
-    pixels_remaining = num_pixels
-    for i in range(int(upper_whole)):
-        pixel = ((num_pixels - 1) - i) if reverse else i
-        strip.setPixelColorRGB(pixel, *progress_color)
-        pixels_remaining -= 1
+    filled = int(upper_whole)
+    strip.pixels[0:filled] = [pack_rgb(*progress_color)] * filled
     if upper_remainder > 0.0:
         tween_color = blend_two_colors(progress_color, base_color, upper_remainder)
-        pixel = ((num_pixels - int(upper_whole)) - 1) if reverse else int(upper_whole)
-        strip.setPixelColorRGB(pixel, *tween_color)
-        pixels_remaining -= 1
-    for i in range(pixels_remaining):
-        pixel = (
-            ((pixels_remaining - 1) - i)
-            if reverse
-            else ((num_pixels - pixels_remaining) + i)
-        )
-        strip.setPixelColorRGB(pixel, *base_color)
-    strip.show()
-    if not q_poll_sleep(0.1, queue):
-        return
+        strip.setPixelColorRGB(filled, *tween_color)
+        filled += 1
+    strip.pixels[filled:num_pixels] = [pack_rgb(*base_color)] * (num_pixels - filled)
+    yield 100
+
+
+def spot(strip, value, color, base_color, max_brightness=255, width=5):
+    """
+    A spot of `width` pixels, centred `value`% of the way along the strip, eg. to light
+    up where the toolhead is
+    """
+    strip.setBrightness(max_brightness)
+    num_pixels = strip.numPixels()
+    width = min(width, num_pixels)
+    centre = int(round((value / 100) * (num_pixels - 1)))
+    first = min(max(centre - width // 2, 0), num_pixels - width)
+    fill(strip, pack_rgb(*base_color))
+    strip.pixels[first : first + width] = [pack_rgb(*color)] * width
+    yield 100
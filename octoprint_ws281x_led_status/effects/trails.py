@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+# Effects with a moving head, leaving a trail that fades away behind it
+from __future__ import absolute_import, division, unicode_literals
+
+import time
+
+from octoprint_ws281x_led_status.effects.basic import CYCLE_STEPS, fill
+from octoprint_ws281x_led_status.framebuffer import pack_rgb, scale_pixels
+
+FRAME_INTERVAL = 20  # ms, trails fade smoothly so want a steady frame rate
+TAIL_FRACTION = 0.25  # Trails fade to TAIL_LEVEL over this share of a pass
+TAIL_LEVEL = 0.1
+
+
+class Trail(object):
+    """
+    Fades the whole frame a little every frame, so anything drawn leaves a trail. The
+    frame is its own intensity buffer - the fade scales every packed pixel at once (see
+    framebuffer.scale_pixels), so it costs the same however long the trails are.
+    """
+
+    def __init__(self, strip, pass_time):
+        """
+        :param strip: framebuffer.FrameBuffer to draw on
+        :param pass_time: secs for the head to cross the strip once
+        """
+        self.strip = strip
+        self.tail_time = pass_time * TAIL_FRACTION
+        self.faded = time.time()
+
+    def fade(self, now):
+        """Fade the frame for the time since the last fade, independent of frame rate"""
+        keep = int(255 * TAIL_LEVEL ** ((now - self.faded) / self.tail_time))
+        self.faded = now
+        self.strip.pixels[:] = scale_pixels(self.strip.pixels, keep)
+
+    def stamp(self, first, last, color):
+        """Light the pixels from first to last (inclusive, either order), eg. all the
+        pixels the head passed over since the last frame"""
+        if first > last:
+            first, last = last, first
+        self.strip.pixels[first : last + 1] = [color] * (last + 1 - first)
+
+
+def passes(pass_time):
+    """
+    :param pass_time: secs for the head to cross the strip once
+    :return: generator of (time.time(), number of passes made so far, as a float)
+    """
+    start = time.time()
+    while True:
+        now = time.time()
+        yield now, (now - start) / pass_time
+
+
+def comet(strip, color, delay, max_brightness=255):
+    strip.setBrightness(max_brightness)
+    fill(strip, 0)
+    num_pixels = strip.numPixels()
+    pass_time = max(delay * CYCLE_STEPS / 1000, 0.001)
+    trail = Trail(strip, pass_time)
+    packed = pack_rgb(*color)
+    previous = 0
+    for now, count in passes(pass_time):
+        head = int((count % 1) * num_pixels)
+        trail.fade(now)
+        if head < previous:  # Gone round to the start again
+            trail.stamp(previous, num_pixels - 1, packed)
+            previous = 0
+        trail.stamp(previous, head, packed)
+        previous = head
+        yield FRAME_INTERVAL
+
+
+def scanner(strip, color, delay, max_brightness=255):
+    strip.setBrightness(max_brightness)
+    fill(strip, 0)
+    num_pixels = strip.numPixels()
+    pass_time = max(delay * CYCLE_STEPS / 1000, 0.001)
+    trail = Trail(strip, pass_time)
+    packed = pack_rgb(*color)
+    previous = 0
+    for now, count in passes(pass_time):
+        distance = count % 2
+        if distance > 1:  # On the way back
+            distance = 2 - distance
+        head = min(int(distance * num_pixels), num_pixels - 1)
+        trail.fade(now)
+        trail.stamp(previous, head, packed)
+        previous = head
+        yield FRAME_INTERVAL
+
+
+def trailing_wipe(strip, color, delay, max_brightness=255):
+    """Wipes the colour on, then off again with the colour fading out behind the wipe"""
+    strip.setBrightness(max_brightness)
+    fill(strip, 0)
+    num_pixels = strip.numPixels()
+    pass_time = max(delay * CYCLE_STEPS / 1000, 0.001)
+    trail = Trail(strip, pass_time)
+    packed = pack_rgb(*color)
+    for now, count in passes(pass_time):
+        distance = count % 2
+        trail.fade(now)
+        if distance < 1:
+            trail.stamp(0, int(distance * num_pixels), packed)
+        else:
+            # Everything behind the head fades, everything in front stays lit
+            head = int((distance - 1) * num_pixels)
+            trail.stamp(head, num_pixels - 1, packed)
+        yield FRAME_INTERVAL
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, unicode_literals
+
+# Pixels are stored packed as 0xWWRRGGBB, the same format as rpi_ws281x.Color, so a frame
+# can be written to the strip without converting it. The helpers below work on two colour
+# channels at once (red & blue, white & green), each in its own 16 bit lane of the int, so
+# a whole frame is processed in one list comprehension with no per-channel unpacking.
+_LANES_LOW = 0x00FF00FF
+_LANES_HIGH = 0xFF00FF00
+
+
+def pack_rgb(red, green, blue, white=0):
+    return (white << 24) | (red << 16) | (green << 8) | blue
+
+
+def scale_pixels(pixels, brightness):
+    """
+    Fold a brightness into the pixel values, the same way rpi_ws281x does when rendering
+    :param pixels: list of packed pixels
+    :param brightness: int 0-255
+    :return: list of packed pixels, scaled
+    """
+    if brightness >= 255:
+        return list(pixels)
+    scale = brightness + 1
+    return [
+        ((((p & _LANES_LOW) * scale) >> 8) & _LANES_LOW)
+        | ((((p >> 8) & _LANES_LOW) * scale) & _LANES_HIGH)
+        for p in pixels
+    ]
+
+
+def blend_pixels(start, end, weight):
+    """
+    Linear interpolation between two frames of equal length
+    :param start: list of packed pixels, shown at weight 0
+    :param end: list of packed pixels, shown at weight 256
+    :param weight: int 0-256
+    :return: list of packed pixels
+    """
+    inverse = 256 - weight
+    return [
+        ((((a & _LANES_LOW) * inverse + (b & _LANES_LOW) * weight) >> 8) & _LANES_LOW)
+        | (
+            ((((a >> 8) & _LANES_LOW) * inverse + ((b >> 8) & _LANES_LOW) * weight))
+            & _LANES_HIGH
+        )
+        for a, b in zip(start, end)
+    ]
+
+
+class FrameBuffer(object):
+    """
+    Stand in for rpi_ws281x.PixelStrip that effects draw into. The runner decides when
+    (and how) the finished frame is sent to the real strip.
+    """
+
+    def __init__(self, num_pixels, brightness=255):
+        self.pixels = [0] * num_pixels
+        self.brightness = brightness
+        # Effects that only change a few pixels a frame can report which ones, so only those
+        # are sent to the strip. See track_changes()
+        self.tracking = False
+        self.changed = (
+            None  # Pixels changed since the last frame, None if any might have
+        )
+
+    def numPixels(self):
+        return len(self.pixels)
+
+    def setPixelColor(self, n, color):
+        self.pixels[n] = color
+
+    def setPixelColorRGB(self, n, red, green, blue, white=0):
+        self.pixels[n] = (white << 24) | (red << 16) | (green << 8) | blue
+
+    def getPixelColor(self, n):
+        return self.pixels[n]
+
+    def setBrightness(self, brightness):
+        self.brightness = brightness
+
+    def getBrightness(self):
+        return self.brightness
+
+    def track_changes(self):
+        """
+        Called by effects that will draw with mark() from now on. The next frame is still
+        sent whole, after that only the marked pixels are.
+        """
+        self.tracking = True
+        self.changed = None
+
+    def stop_tracking(self):
+        self.tracking = False
+        self.changed = None
+
+    def mark(self, n, color):
+        """Set a pixel to a packed colour, and record that it changed"""
+        self.pixels[n] = color
+        if self.changed is not None:
+            self.changed.append(n)
+
+    def take_changes(self):
+        """
+        :return: list of pixels changed since this was last called, or None for all of them
+        """
+        changed = self.changed
+        self.changed = [] if self.tracking else None
+        return changed
+
+    def scaled(self):
+        """The frame as it will look on the strip, with brightness applied"""
+        return scale_pixels(self.pixels, self.brightness)
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+# Parsing of the gcode commands the plugin intercepts, done in OctoPrint's process so
+# the effect runner is sent values it can use straight away.
+from __future__ import absolute_import, division, unicode_literals
+
+from collections import namedtuple
+from string import ascii_letters
+
+# An M150 command, ready to show. red, green & blue already include white, when it is
+# sent on its own (see parse_m150). index is the (first, last) LED to set, both
+# inclusive, or None for all of them. strip is the output the LEDs are on, or None when
+# they are counted along the whole strip.
+M150 = namedtuple(
+    "M150", ["red", "green", "blue", "white", "brightness", "index", "strip"]
+)
+
+# What each letter is in an M150 command: the index of the value a parameter letter
+# sets, or -1 for other letters. Anything else isn't in the table.
+_M150_LETTERS = dict.fromkeys(ascii_letters, -1)
+_M150_LETTERS.update(
+    {
+        "R": 0,
+        "r": 0,
+        "G": 1,
+        "g": 1,
+        "U": 1,  # Marlin's name for green
+        "u": 1,
+        "B": 2,
+        "b": 2,
+        "W": 3,
+        "w": 3,
+        "P": 4,
+        "p": 4,
+        "I": 5,  # LED index
+        "i": 5,
+        "S": 6,  # Strip, ie. output
+        "s": 6,
+    }
+)
+_DIGITS = frozenset("0123456789")
+_MAX_DIGITS = 3  # Colours & brightness
+_MAX_INDEX_DIGITS = 5  # LED index & strip
+
+
+# Example command: M150 R10 G200 B300
+# more -> https://github.com/cp2004/OctoPrint-WS281x_LED_Status/wiki/Features#m150-intercept
+def parse_m150(command, brightness=255):
+    """
+    Read the colour from an M150 command, eg. 'M150 R10 U200 B255', in a single pass.
+    Parameters that are not given are 0, so 'M150' on its own turns the LEDs off.
+
+    A parameter is its letter followed by up to 3 digits (5 for I & S), and only counts at
+    the start of the command or after something other than a letter - the character
+    before it can't be part of the previous parameter, so 'R10G20' is only red. White (W)
+    sets all the colours, unless R, G or B has been given before it, for compatibility
+    with OctoPrint-M150control (issue #33). Colours over 255 are capped.
+
+    As in Marlin, I sets a single LED and S picks the strip (output) it is on. As well
+    as Marlin's single index, I can be a range, eg. 'M150 I10-19 R255' sets 10 LEDs.
+
+    :param command: M150 command, as sent to the printer
+    :param brightness: brightness to use when there is no P parameter, 0-255
+    :return: M150 tuple
+    """
+    letters = _M150_LETTERS  # Local name, it is looked up for every character
+    values = [0, 0, 0, 0, brightness, None, None]
+    color_included = False
+    length = len(command)
+    start_allowed = True  # Whether a parameter can start at position i
+    i = 0
+    while i < length:
+        kind = letters.get(command[i])
+        i += 1
+        if kind is None:  # Not a letter
+            start_allowed = True
+            continue
+        if kind < 0 or not start_allowed:
+            start_allowed = False
+            continue
+
+        end = i
+        limit = i + (_MAX_DIGITS if kind < 5 else _MAX_INDEX_DIGITS)
+        while end < limit and end < length and command[end] in _DIGITS:
+            end += 1
+        start_allowed = False  # After a letter, or the last digit of this parameter
+        if end == i:  # Letter without a value
+            continue
+        value = int(command[i:end])
+        i = end
+
+        if kind == 5:
+            last = value
+            if i + 1 < length and command[i] == "-" and command[i + 1] in _DIGITS:
+                end = i + 1
+                limit = end + _MAX_INDEX_DIGITS
+                while end < limit and end < length and command[end] in _DIGITS:
+                    end += 1
+                last = int(command[i + 1 : end])
+                i = end
+            values[5] = (value, last) if value <= last else (last, value)
+            continue
+        if kind == 6:
+            values[6] = value
+            continue
+
+        if value > 255:
+            value = 255
+        if kind < 3:
+            values[kind] = value
+            color_included = True
+        elif kind == 3:
+            values[3] = value
+            if not color_included:
+                values[0] = values[1] = values[2] = value
+        else:
+            values[4] = value
+    return M150(*values)
+
+
+# Characters that can be part of a coordinate, see axis_position
+_COORDINATE = frozenset("0123456789.-+")
+
+
+def axis_position(command, axis):
+    """
+    Find where a move sends an axis, eg. axis_position('G1 X10.5 Y20 E0.1', 'X') is 10.5.
+    Run on the comm thread for every move, so the command isn't split up: the axis is
+    found with str.find, and the only objects made are the value's slice and float.
+    :param command: G0/G1 command, without comments (as OctoPrint's hooks are given it)
+    :param axis: axis letter, upper case
+    :return: float position, or None if the command doesn't move that axis
+    """
+    start = command.find(axis, 2) + 1  # After the G0/G1
+    if not start:
+        return None
+    end = command.find(" ", start)
+    if end == -1:
+        end = len(command)
+    try:
+        return float(command[start:end])
+    except ValueError:
+        pass
+    # Not followed by a space, eg. 'G1X10Y20', look for the end of the number instead
+    end = start
+    while end < len(command) and command[end] in _COORDINATE:
+        end += 1
+    try:
+        return float(command[start:end])
+    except ValueError:
+        return None
+
+
+# Lines from the firmware that switch modes. Almost every line received is 'ok' or a
+# temperature report, so lines are checked by their first character before anything
+# else, and only the few that could match go on to the prefix & substring checks.
+_RECEIVED_FIRST_CHARACTERS = frozenset("Ee!/")
+_RECEIVED_PREFIXES = ("Error:", "error:", "!!", "//action:")
+# Errors that stop the printer, in lower case. Others, like checksum mismatches, are
+# recovered from, so are ignored.
+FATAL_ERRORS = (
+    "thermal runaway",
+    "heating failed",
+    "maxtemp",
+    "mintemp",
+    "printer halted",
+    "kill() called",
+)
+# Host actions (//action:<name>) that switch modes
+ACTION_MODES = {
+    "pause": "paused",
+    "paused": "paused",
+    "out_of_filament": "paused",
+    "cancel": "failed",
+}
+
+
+def received_mode(line):
+    """
+    Work out if a line from the firmware should switch modes: fatal errors ('Error:' or
+    '!!' lines) switch to 'failed', host actions go by ACTION_MODES.
+    :param line: line received from the printer
+    :return: name of the mode to switch to, or None
+    """
+    if (
+        not line
+        or line[0] not in _RECEIVED_FIRST_CHARACTERS
+        or not line.startswith(_RECEIVED_PREFIXES)
+    ):
+        return None
+    if line.startswith("//action:"):
+        action = line[len("//action:") :].split()
+        return ACTION_MODES.get(action[0]) if action else None
+    if line.startswith("!!"):  # Fatal error, eg. Klipper shutting down
+        return "failed"
+    line = line.lower()
+    for error in FATAL_ERRORS:
+        if error in line:
+            return "failed"
+    return None
+
+
+class GcodeRule(object):
+    """
+    Switches to a mode when a gcode command is sent, eg. 'paused' for M600. Rules are
+    looked up by the command (see compile_rules), so only the rules for the command
+    sent have their parameters checked.
+    """
+
+    def __init__(self, mode, parameters=None):
+        """
+        :param mode: name of the mode to switch to
+        :param parameters: parameters the command must have, eg. 'S1 T' for S equal to
+            1 and any T. None or empty to match the command whatever its parameters.
+        """
+        self.mode = mode
+        self.parameters = parse_parameters(parameters or "")
+
+    def matches(self, command):
+        """
+        :param command: full gcode command, eg. 'M600 T0'
+        :return: (bool) whether the command has the rule's parameters
+        """
+        if not self.parameters:
+            return True
+        words = command.split(None, 1)
+        given = parse_parameters(words[1]) if len(words) > 1 else {}
+        for letter, value in self.parameters.items():
+            if letter not in given:
+                return False
+            if value is not None and given[letter] != value:
+                return False
+        return True
+
+
+def compile_rules(rules):
+    """
+    :param rules: list of (gcode, GcodeRule), eg. ('M600', GcodeRule('paused'))
+    :return: dict of gcode (eg. 'M600', as OctoPrint's gcode hooks are given it) to the
+        list of its rules, in order
+    """
+    compiled = {}
+    for gcode, rule in rules:
+        compiled.setdefault(gcode.strip().upper(), []).append(rule)
+    return compiled
+
+
+def parse_parameters(text):
+    """
+    :param text: gcode parameters, eg. 'X10 Y2.5 E'
+    :return: dict of parameter letter (upper case) to value, or None if there is no
+        value, eg. {'X': 10.0, 'Y': 2.5, 'E': None}
+    """
+    parameters = {}
+    for word in text.split():
+        try:
+            value = float(word[1:]) if len(word) > 1 else None
+        except ValueError:
+            value = None
+        parameters[word[0].upper()] = value
+    return parameters
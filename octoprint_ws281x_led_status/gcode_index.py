@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+# Index of what is in a gcode file, built once in the background so nothing has to read
+# the file while it is printing.
+from __future__ import absolute_import, division, unicode_literals
+
+import hashlib
+import io
+import json
+import logging
+import mmap
+import os
+import re
+import threading
+import time
+
+INDEX_VERSION = 2  # Bump when what is indexed changes, so old indexes are rebuilt
+
+# Heater commands, and the heater they set
+HEATER_CODES = {
+    b"M104": "tool",
+    b"M109": "tool",
+    b"M140": "bed",
+    b"M190": "bed",
+    b"M141": "chamber",
+    b"M191": "chamber",
+}
+# A gcode word: its letter and the number after it, eg. ('Z', '0.2')
+# Not a raw string: Python 2 only takes br"", which black rewrites as rb""
+_WORD = re.compile(b"([A-Z])\\s*([-+]?[0-9.]*)")
+_COMMAND_STARTS = (b"G", b"g", b"M", b"m")
+_MOVE_STARTS = (b"G1 ", b"G0 ")
+MAX_HEATER_COMMANDS = 100  # Kept in an index, so it stays small
+
+
+def _number(text):
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return None
+
+
+def index_lines(lines):
+    """
+    Read through gcode, for what it builds and the commands in it.
+
+    Layers are counted as the heights extruding moves go up to, so z-hops & the lift at
+    the end of a print don't count, and the max Z is the height of the top one.
+    :param lines: iterable of (byte offset, line) in the file, lines as bytes
+    :return: dict with
+        'layers': number of layers,
+        'max_z': height of the top layer, or None if nothing is extruded,
+        'm150': number of M150 commands,
+        'heaters': list of [byte offset, heater (from HEATER_CODES), target or None],
+            for the first MAX_HEATER_COMMANDS heater commands
+    """
+    z = 0.0
+    max_z = None
+    layers = 0
+    relative = False
+    m150 = 0
+    heaters = []
+    for offset, line in lines:
+        if not line.startswith(_COMMAND_STARTS):
+            continue
+        # Almost every line is a move within the current layer, which can't change
+        # anything indexed, so those are skipped before parsing them
+        if (
+            max_z is not None
+            and z <= max_z
+            and line.startswith(_MOVE_STARTS)
+            and b"Z" not in line
+            and b"z" not in line
+        ):
+            continue
+        words = _WORD.findall(line.split(b";", 1)[0].upper())
+        if not words:
+            continue
+        code = b"".join(words[0])
+        if code in (b"G1", b"G0", b"G01", b"G00"):
+            parameters = dict(words[1:])
+            if b"Z" in parameters:
+                move = _number(parameters[b"Z"])
+                if move is not None:
+                    z = z + move if relative else move
+            if (max_z is None or z > max_z) and (
+                b"X" in parameters or b"Y" in parameters
+            ):
+                extrude = _number(parameters.get(b"E"))
+                if extrude is not None and extrude > 0:
+                    max_z = z
+                    layers += 1
+        elif code == b"G90" or code == b"G91":
+            relative = code == b"G91"
+        elif code == b"G92":
+            move = _number(dict(words[1:]).get(b"Z"))
+            if move is not None:
+                z = move
+        elif code == b"M150":
+            m150 += 1
+        elif code in HEATER_CODES and len(heaters) < MAX_HEATER_COMMANDS:
+            parameters = dict(words[1:])
+            target = _number(parameters.get(b"S", parameters.get(b"R")))
+            heaters.append([offset, HEATER_CODES[code], target])
+    return {"layers": layers, "max_z": max_z, "m150": m150, "heaters": heaters}
+
+
+def _mapped_lines(mapped):
+    offset = 0
+    for line in iter(mapped.readline, b""):
+        yield offset, line
+        offset += len(line)
+
+
+def index_file(path):
+    """
+    Index a gcode file (see index_lines), reading it once through a memory map, so even
+    big files aren't copied into memory.
+    :param path: path to the file on disk
+    :return: dict, see index_lines
+    """
+    with io.open(path, "rb") as file:
+        if not os.fstat(file.fileno()).st_size:  # Empty files can't be mapped
+            return index_lines([])
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return index_lines(_mapped_lines(mapped))
+        finally:
+            mapped.close()
+
+
+class GcodeIndex(object):
+    """
+    Indexes of the gcode files, kept in memory and on disk as a small JSON file per gcode
+    file. An index is only used while the file's modification time & size match, so an
+    edited file is indexed again, but otherwise a file is only ever read once.
+    """
+
+    def __init__(self, folder, logger=None):
+        """
+        :param folder: folder to keep the indexes in, eg. in the plugin's data folder
+        :param logger: logging.Logger, for reporting indexing & errors
+        """
+        self.folder = folder
+        self._logger = logger or logging.getLogger(__name__)
+        self._indexes = {}  # Path: index, for the files looked up or indexed so far
+        self._indexing = set()  # Paths being indexed in the background
+        self._lock = threading.Lock()
+
+    def lookup(self, path):
+        """
+        :param path: path of the gcode file on disk
+        :return: the file's index (see index_lines, plus 'path', 'mtime' & 'size'), or
+            None if the file hasn't been indexed since it last changed
+        """
+        try:
+            key = self._key(path)
+        except OSError:  # Deleted, so its index is no use any more
+            self.remove(path)
+            return None
+        index = self._indexes.get(path)
+        if index is None:
+            index = self._load(path)
+        if index is None or self._key_of(index) != key:
+            return None
+        self._indexes[path] = index
+        return index
+
+    def index_in_background(self, path, callback=None):
+        """
+        Index a file on a separate thread, unless it is indexed (see lookup) or already
+        being indexed.
+        :param path: path of the gcode file on disk
+        :param callback: called with the index once it is built, or straight away if the
+            file is already indexed
+        :return: None
+        """
+        index = self.lookup(path)
+        if index is not None:
+            if callback is not None:
+                callback(index)
+            return
+        with self._lock:
+            if path in self._indexing:
+                return
+            self._indexing.add(path)
+        thread = threading.Thread(
+            target=self._build,
+            args=(path, callback),
+            name="WS281x LED Status gcode index",
+        )
+        thread.daemon = True
+        thread.start()
+
+    def remove(self, path):
+        """
+        Remove the index of a file, eg. when the file is deleted
+        :param path: path of the gcode file on disk
+        :return: None
+        """
+        self._indexes.pop(path, None)
+        try:
+            os.remove(self._index_path(path))
+        except OSError:  # Wasn't indexed
+            pass
+
+    def prune(self):
+        """
+        Remove indexes of files that no longer exist, or are from an older version.
+        Files are removed from the index as they are deleted or moved, this catches any
+        changed while OctoPrint wasn't running.
+        :return: None
+        """
+        try:
+            names = os.listdir(self.folder)
+        except OSError:  # Nothing indexed yet
+            return
+        for name in names:
+            if not name.endswith(".json"):  # eg. an index being written
+                continue
+            index_path = os.path.join(self.folder, name)
+            try:
+                with io.open(index_path, "rt", encoding="utf-8") as file:
+                    index = json.load(file)
+                if index.get("version") == INDEX_VERSION and os.path.isfile(
+                    index.get("path")
+                ):
+                    continue
+            except (IOError, OSError, TypeError, ValueError, AttributeError):
+                pass  # Unreadable
+            try:
+                os.remove(index_path)
+            except OSError as e:
+                self._logger.warning("Failed to remove {}: {}".format(index_path, e))
+
+    def _build(self, path, callback):
+        try:
+            start = time.time()
+            try:
+                mtime, size = self._key(path)
+                index = index_file(path)
+            except (IOError, OSError, ValueError) as e:
+                self._logger.error("Failed to index {}: {}".format(path, e))
+                return
+            index.update({"path": path, "mtime": mtime, "size": size})
+            self._logger.debug(
+                "Indexed {} in {:.2f}s: {} layers up to Z{}, {} M150 & {} heater"
+                " commands".format(
+                    path,
+                    time.time() - start,
+                    index["layers"],
+                    index["max_z"],
+                    index["m150"],
+                    len(index["heaters"]),
+                )
+            )
+            self._indexes[path] = index
+            self._save(index)
+        finally:
+            with self._lock:
+                self._indexing.discard(path)
+        if callback is not None:
+            callback(index)
+
+    @staticmethod
+    def _key(path):
+        stat = os.stat(path)
+        return stat.st_mtime, stat.st_size
+
+    @staticmethod
+    def _key_of(index):
+        return index.get("mtime"), index.get("size")
+
+    def _index_path(self, path):
+        # One index file per gcode file, so re-indexing a changed file replaces its index
+        name = hashlib.sha1(path.encode("utf-8")).hexdigest()
+        return os.path.join(self.folder, name + ".json")
+
+    def _load(self, path):
+        try:
+            with io.open(self._index_path(path), "rt", encoding="utf-8") as file:
+                index = json.load(file)
+        except (IOError, OSError, ValueError):  # Not indexed yet, or unreadable
+            return None
+        if index.get("version") != INDEX_VERSION or index.get("path") != path:
+            return None
+        return index
+
+    def _save(self, index):
+        index = dict(index, version=INDEX_VERSION)
+        index_path = self._index_path(index["path"])
+        try:
+            if not os.path.isdir(self.folder):
+                os.makedirs(self.folder)
+            # Written to a temporary file first, so a half written index is never read
+            with io.open(index_path + ".tmp", "wb") as file:
+                file.write(json.dumps(index).encode("utf-8"))
+            if os.path.exists(index_path):
+                os.remove(index_path)
+            os.rename(index_path + ".tmp", index_path)
+        except (IOError, OSError) as e:
+            self._logger.warning(
+                "Failed to save index of {}: {}".format(index["path"], e)
+            )
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, unicode_literals
+
+import io
+import multiprocessing
+import os
+
+THERMAL_ZONE = "/sys/class/thermal/thermal_zone0/temp"  # SoC temperature on a Pi
+
+# Pressure levels, from least to most pressure: (name, fraction of max fps, thresholds)
+# A level is entered when the load per core or the SoC temperature (°C) reaches its
+# thresholds, and left once both are back below them by the hysteresis margins.
+LEVELS = [
+    ("normal", 1, (0, 0)),
+    ("reduced", 0.5, (1.0, 70)),
+    ("minimal", 0.2, (2.0, 78)),
+]
+LOAD_HYSTERESIS = 0.25
+TEMPERATURE_HYSTERESIS = 3
+
+
+def read_load():
+    """:return: 1 minute load average per CPU core, or None if it is not available"""
+    try:
+        return os.getloadavg()[0] / multiprocessing.cpu_count()
+    except (AttributeError, OSError, NotImplementedError):
+        return None
+
+
+def read_temperature():
+    """:return: SoC temperature in °C, or None if it is not available"""
+    try:
+        with io.open(THERMAL_ZONE, "rt") as file:
+            return int(file.read().strip()) / 1000
+    except (IOError, OSError, ValueError):
+        return None
+
+
+class FrameRateGovernor(object):
+    """
+    Lowers the runner's frame rate while the Pi is busy or running hot, so the LEDs don't
+    compete with OctoPrint's serial communication. At the highest level, the more
+    expensive effects (like fading between effects) are skipped too.
+    """
+
+    def __init__(self, max_fps, enabled=True):
+        self.max_fps = max_fps
+        self.enabled = enabled
+        self.level = 0
+        self.load = None
+        self.temperature = None
+
+    @property
+    def state(self):
+        return LEVELS[self.level][0]
+
+    @property
+    def fps(self):
+        return self.max_fps * LEVELS[self.level][1]
+
+    @property
+    def frame_interval(self):
+        return 1 / self.fps
+
+    @property
+    def cheap(self):
+        """Whether to skip expensive rendering, like transitions"""
+        return self.level == len(LEVELS) - 1
+
+    def _reached(self, level, margin=False):
+        max_load, max_temperature = LEVELS[level][2]
+        load_margin = LOAD_HYSTERESIS if margin else 0
+        temperature_margin = TEMPERATURE_HYSTERESIS if margin else 0
+        return (self.load is not None and self.load >= max_load - load_margin) or (
+            self.temperature is not None
+            and self.temperature >= max_temperature - temperature_margin
+        )
+
+    def update(self):
+        """
+        Sample the load & temperature, and move between levels
+        :return: (bool) whether the level changed
+        """
+        if not self.enabled:
+            return False
+        self.load = read_load()
+        self.temperature = read_temperature()
+
+        level = self.level
+        # Step up as far as the readings go
+        while level + 1 < len(LEVELS) and self._reached(level + 1):
+            level += 1
+        # Only step down once clear of the thresholds, to avoid flapping between levels
+        while level > 0 and not self._reached(level, margin=True):
+            level -= 1
+
+        changed = level != self.level
+        self.level = level
+        return changed
+
+    def report(self):
+        return {
+            "enabled": self.enabled,
+            "state": self.state,
+            "fps": round(self.fps, 1),
+            "load": round(self.load, 2) if self.load is not None else None,
+            "temperature": round(self.temperature, 1)
+            if self.temperature is not None
+            else None,
+        }
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, unicode_literals
+
+from operator import itemgetter
+
+
+MATRIX_ORIGINS = ["top_left", "top_right", "bottom_left", "bottom_right"]
+
+
+def strip_order(num_leds, reverse=False, offset=0, skip=None, serpentine_width=0):
+    """
+    Order of the LEDs along a strip, for PixelMapping
+    :param num_leds: number of physical LEDs
+    :param reverse: (bool) run effects from the other end of the strip
+    :param offset: number of LEDs to move the first pixel along by, wrapping around
+    :param skip: list of physical LED indexes to leave off, eg. ones hidden in a corner
+    :param serpentine_width: length of the rows, when every other row runs backwards.
+        0 for a plain strip.
+    :return: list of physical LED indexes, in the order pixels should be drawn on them
+    """
+    order = list(range(num_leds))
+    if serpentine_width > 0:
+        for row_start in range(serpentine_width, num_leds, serpentine_width * 2):
+            row_end = min(row_start + serpentine_width, num_leds)
+            order[row_start:row_end] = order[row_start:row_end][::-1]
+    if skip:
+        skip = set(skip)
+        order = [led for led in order if led not in skip]
+    if reverse:
+        order.reverse()
+    if order:
+        offset %= len(order)
+        order = order[offset:] + order[:offset]
+    return order
+
+
+def matrix_order(width, height, serpentine=True, origin="top_left", vertical=False):
+    """
+    Order of the LEDs in a matrix, for PixelMapping. Pixels are drawn a row at a time,
+    starting from the top left, however the matrix is wired.
+    :param width: number of LEDs across
+    :param height: number of LEDs down
+    :param serpentine: (bool) every other line of LEDs runs backwards, else all lines
+        run the same way
+    :param origin: corner the first LED is in, from MATRIX_ORIGINS
+    :param vertical: (bool) LEDs are wired in columns, rather than rows
+    :return: list of physical LED indexes, in the order pixels should be drawn on them
+    """
+    line_length = height if vertical else width
+    order = []
+    for y in range(height):
+        # Row & column counted from the first LED
+        row = height - 1 - y if origin.startswith("bottom") else y
+        for x in range(width):
+            column = width - 1 - x if origin.endswith("right") else x
+            line, along = (column, row) if vertical else (row, column)
+            if serpentine and line % 2:
+                along = line_length - 1 - along
+            order.append(line * line_length + along)
+    return order
+
+
+class PixelMapping(object):
+    """
+    Maps the pixels that effects draw onto the physical LEDs, handling reversing, offsets,
+    skipped LEDs, serpentine layouts & matrices. The mapping is worked out once, as the
+    index of the pixel to show on each LED, so applying it to a frame is a single gather
+    rather than any per-pixel arithmetic.
+    """
+
+    def __init__(self, num_leds, order):
+        """
+        :param num_leds: number of physical LEDs
+        :param order: list of physical LED indexes, in the order pixels should be drawn on
+            them. See strip_order & matrix_order. LEDs left out are kept blank.
+        """
+        self.num_leds = num_leds
+        self.num_pixels = len(order)  # Number of pixels effects should draw
+        self.order = order  # Physical LED for each pixel
+
+        # Skipped LEDs take the extra, blank, pixel on the end of the frame
+        self.index = [self.num_pixels] * num_leds
+        for pixel, led in enumerate(order):
+            self.index[led] = pixel
+
+        self._pad = [0] if self.num_pixels < num_leds else None
+        self.identity = not self._pad and self.index == list(range(num_leds))
+        if self.identity:
+            self._gather = None
+        elif num_leds == 1:  # itemgetter returns a single item, not a tuple
+            self._gather = lambda pixels, i=self.index[0]: (pixels[i],)
+        else:
+            self._gather = itemgetter(*self.index)
+
+    def apply(self, pixels):
+        """
+        :param pixels: sequence of packed pixels, self.num_pixels long
+        :return: sequence of packed pixels, in physical LED order
+        """
+        if self.identity:
+            return pixels
+        if self._pad:
+            pixels = pixels + self._pad
+        return self._gather(pixels)
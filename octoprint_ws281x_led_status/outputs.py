@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, unicode_literals
+
+import atexit
+from itertools import islice
+
+from rpi_ws281x import ws
+
+from octoprint_ws281x_led_status.stats import TimingStats
+
+
+class Output(object):
+    """
+    One channel of the controller. Takes its pixels from the runner's frame, starting at `start`
+    """
+
+    def __init__(self, leds, index, start, settings):
+        self.index = index
+        self.start = start
+        self.count = settings["led_count"]
+        self.write_time = TimingStats()
+
+        self._channel = ws.ws2811_channel_get(leds, index)
+        ws.ws2811_channel_t_gamma_set(self._channel, list(range(256)))
+        ws.ws2811_channel_t_count_set(self._channel, self.count)
+        ws.ws2811_channel_t_gpionum_set(self._channel, settings["led_pin"])
+        ws.ws2811_channel_t_invert_set(
+            self._channel, 1 if settings["led_invert"] else 0
+        )
+        ws.ws2811_channel_t_brightness_set(self._channel, settings["led_brightness"])
+        ws.ws2811_channel_t_strip_type_set(self._channel, settings["strip_type"])
+
+    def write(self, pixels, brightness):
+        """
+        Copy this output's part of the frame into the controller's buffer
+        :param pixels: list of packed pixels for the whole frame
+        :param brightness: int 0-255
+        """
+        ws.ws2811_channel_t_brightness_set(self._channel, brightness)
+        channel = self._channel
+        led_set = ws.ws2811_led_set
+        for n, color in enumerate(islice(pixels, self.start, self.start + self.count)):
+            led_set(channel, n, color)
+
+    def set(self, n, color):
+        ws.ws2811_led_set(self._channel, n, color)
+
+
+class Controller(object):
+    """
+    Drives one or both channels of rpi_ws281x. The channels share DMA & frequency, so are
+    set up and rendered together - one show() updates both strips.
+    Based on rpi_ws281x.PixelStrip, which only sets up a single channel.
+    """
+
+    def __init__(self, outputs_settings, freq_hz, dma):
+        """
+        :param outputs_settings: list of dicts, led_count, led_pin, led_invert, led_brightness,
+            led_channel & strip_type (the rpi_ws281x value). Each channel can be used once.
+        :param freq_hz: int, signal frequency
+        :param dma: int, DMA channel
+        """
+        self._leds = ws.new_ws2811_t()
+        for index in range(2):
+            channel = ws.ws2811_channel_get(self._leds, index)
+            ws.ws2811_channel_t_count_set(channel, 0)
+            ws.ws2811_channel_t_gpionum_set(channel, 0)
+            ws.ws2811_channel_t_invert_set(channel, 0)
+            ws.ws2811_channel_t_brightness_set(channel, 0)
+
+        self.outputs = []
+        start = 0
+        for settings in outputs_settings:
+            output = Output(self._leds, settings["led_channel"], start, settings)
+            self.outputs.append(output)
+            start += output.count
+        self._num_pixels = start
+
+        ws.ws2811_t_freq_set(self._leds, freq_hz)
+        ws.ws2811_t_dmanum_set(self._leds, dma)
+
+        atexit.register(self._cleanup)
+
+    def _cleanup(self):
+        if self._leds is not None:
+            ws.ws2811_fini(self._leds)
+            ws.delete_ws2811_t(self._leds)
+            self._leds = None
+
+    def begin(self):
+        resp = ws.ws2811_init(self._leds)
+        if resp != 0:
+            raise RuntimeError(
+                "ws2811_init failed with code {0} ({1})".format(
+                    resp, ws.ws2811_get_return_t_str(resp)
+                )
+            )
+
+    def set_led(self, led, color):
+        """
+        Set a single LED in the controller's buffer, for when only a few have changed
+        :param led: index across all the outputs
+        :param color: packed pixel
+        """
+        for output in self.outputs:
+            if output.start <= led < output.start + output.count:
+                output.set(led - output.start, color)
+                return
+
+    def numPixels(self):
+        """Total pixels across all the outputs"""
+        return self._num_pixels
+
+    def show(self):
+        resp = ws.ws2811_render(self._leds)
+        if resp != 0:
+            raise RuntimeError(
+                "ws2811_render failed with code {0} ({1})".format(
+                    resp, ws.ws2811_get_return_t_str(resp)
+                )
+            )
@@ -1,18 +1,55 @@
 # -*- coding: utf-8 -*-
-from __future__ import unicode_literals
+from __future__ import division, unicode_literals
 
+import gc
 import logging
-import re
+import os
 import time
+from functools import partial
 
 import rpi_ws281x
-from rpi_ws281x import PixelStrip
 
-from octoprint_ws281x_led_status.effects import basic, progress
+from octoprint_ws281x_led_status.compositor import OPAQUE, Segment
+from octoprint_ws281x_led_status.effects import (
+    basic,
+    matrix,
+    noise,
+    progress,
+    trails,
+)
+from octoprint_ws281x_led_status.framebuffer import (
+    FrameBuffer,
+    pack_rgb,
+    scale_pixels,
+)
+from octoprint_ws281x_led_status.gcode import M150
+from octoprint_ws281x_led_status.governor import FrameRateGovernor
+from octoprint_ws281x_led_status.mapping import (
+    PixelMapping,
+    matrix_order,
+    strip_order,
+)
+from octoprint_ws281x_led_status.outputs import Controller
+from octoprint_ws281x_led_status.stats import CountStats, TimingStats
 from octoprint_ws281x_led_status.util import hex_to_rgb
 
+try:
+    from queue import Empty
+except ImportError:
+    # Python 2
+    from Queue import Empty
+
 KILL_MSG = "KILL"
-STRIP_SETTINGS = [  # ALL LED SETTINGS, for rpi_ws281x.PixelStrip
+TORCH_OFF_MSG = "torch_off"
+TOOLHEAD_OFF_MSG = "toolhead_off"
+ACTIVE_CHECK_INTERVAL = 10  # secs, between checking active times
+STATS_INTERVAL = 10  # secs, between sending stats to the plugin
+GOVERNOR_INTERVAL = 5  # secs, between checking system load & temperature
+# Collect less often than the default (700, 10, 10). Frames create few objects, so this
+# mostly avoids collections (and the frame hitches they cause) altogether
+GC_THRESHOLDS = (5000, 50, 50)
+LAYERS = ["base", "progress", "overlay"]  # Bottom to top, see EffectRunner.set_mode
+STRIP_SETTINGS = [  # ALL LED SETTINGS, for outputs.Controller
     "led_count",
     "led_pin",
     "led_freq_hz",
@@ -22,6 +59,9 @@ STRIP_SETTINGS = [  # ALL LED SETTINGS, for rpi_ws281x.PixelStrip
     "led_channel",
     "strip_type",
     "reverse",
+    "led_offset",
+    "led_skip",
+    "serpentine_width",
 ]
 STRIP_TYPES = {  # Adding any more strips requires a request, then testing
     "WS2811_STRIP_GRB": rpi_ws281x.WS2811_STRIP_GRB,
@@ -53,9 +93,28 @@ EFFECTS = {
     "blink": basic.blink,
     "cross": basic.crossover,
     "balls": basic.bouncy_balls,
+    "comet": trails.comet,
+    "scanner": trails.scanner,
+    "trail_wipe": trails.trailing_wipe,
+    "fire": noise.fire,
+    "plasma": noise.plasma,
     "progress_print": progress.progress,
     "progress_heatup": progress.progress,
     "progress_cooling": progress.progress,
+    "toolhead": progress.spot,
+}
+PROCESS_SCHEDULERS = {  # Setting value: name of the os.SCHED_* policy
+    "normal": "SCHED_OTHER",
+    "fifo": "SCHED_FIFO",
+    "rr": "SCHED_RR",
+}
+MATRIX_EFFECTS = {  # Used in place of EFFECTS on segments covering whole matrix rows
+    "wipe": matrix.color_wipe,
+    "wipe2": matrix.color_wipe_2,
+    "cycle": matrix.rainbow_cycle,
+    "progress_print": matrix.progress,
+    "progress_heatup": matrix.progress,
+    "progress_cooling": matrix.progress,
 }
 MODES = [
     "startup",
@@ -71,21 +130,22 @@ MODES = [
     "torch",
 ]
 
-# Example command: M150 R10 G200 B300
-# more -> https://github.com/cp2004/OctoPrint-WS281x_LED_Status/wiki/Features#m150-intercept
-M150_REGEX = (
-    r"(^|[^A-Za-z])[Rr](?P<red>\d{1,3})|(^|[^A-Za-z])[GgUu](?P<green>\d{1,3})|(^|[^A-Za-z])"
-    r"[Bb](?P<blue>\d{1,3})|(^|[^A-Za-z])[Pp](?P<brightness>\d{1,3})|(^|[^A-Za-z])[Ww](?P<white>\d{1,3})"
-)
-
 
 class EffectRunner:
-    def __init__(self, log_path, debug, queue, all_settings, previous_state):
+    def __init__(
+        self, log_path, debug, queue, stats_queue, all_settings, previous_state
+    ):
         self._logger = logging.getLogger("octoprint.plugins.ws281x_led_status.debug")
         self.setup_custom_logger(log_path, debug)
         self.settings = all_settings
-        self.reverse = all_settings["strip"]["reverse"]
+        self.process_state = self.apply_process_settings()
         self.max_brightness = all_settings["strip"]["led_brightness"]
+        # Width of the LED matrix, None when it is a plain strip
+        self.matrix_width = (
+            all_settings["matrix"]["width"]
+            if all_settings["matrix"]["enabled"]
+            else None
+        )
         self.lights_on = True
 
         self.previous_state = (
@@ -110,12 +170,45 @@ class EffectRunner:
             self.end_time = (int(end[0]) * 60) + int(end[1])
         self.active_times_state = True
 
+        # Effects fade into each other over this many seconds, 0 disables
+        self.transition_duration = all_settings["runner"]["transition_duration"] / 1000
+        # Frames are not shown more often than the governor allows, however fast the
+        # effects want to go
+        self.governor = FrameRateGovernor(
+            all_settings["runner"]["max_fps"], all_settings["runner"]["governor"]
+        )
+
         self.queue = queue
+        self.stats_queue = stats_queue
         self.strip = self.start_strip()
         if not self.strip:
             self._logger.info("No strip initialised, exiting the effect process.")
             return
 
+        self.mapping = self.create_mapping()
+        self.segments = self.create_segments()
+        self.pixels = [0] * self.mapping.num_pixels  # Segments are put together in here
+        # M150 commands draw into this, and it is kept between them, so commands
+        # setting single LEDs build up a pattern
+        self.m150 = FrameBuffer(self.mapping.num_pixels, self.max_brightness)
+        self.m150_pending = []  # Commands to draw in the next frame
+        # received = dropped (covered by a later command) + merged (shown in the same
+        # frame as a later command) + frames
+        self.m150_stats = CountStats("received", "dropped", "merged", "frames")
+        self.active = True  # Lights are on, and within active times
+        self.active_check_due = 0  # time.time() to next check active times
+        self.governor_due = 0  # time.time() to next update the governor
+        self.render_time = TimingStats()
+        self.delta_write_time = TimingStats()  # Frames where only changed LEDs are sent
+        self.shown_brightness = None
+        self.frame_jitter = TimingStats()  # How late scheduled frames are rendered
+        self.stats_start = time.time()
+        self.stats_due = self.stats_start + STATS_INTERVAL
+        self.next_frame = 0  # time.time() that render_frame should next be called
+        self._changed = []  # Segments changed in this frame, reused by render_frame
+
+        self.tune_gc()
+
         if debug:
             self.log_settings()
         else:
@@ -124,6 +217,17 @@ class EffectRunner:
             )
         self.main_loop()
 
+    def tune_gc(self):
+        """
+        The effect process is forked from OctoPrint, so starts with all of its objects.
+        Freeze them, so the garbage collector doesn't walk through them all while effects
+        are running.
+        """
+        gc.collect()
+        if hasattr(gc, "freeze"):  # Python 3.7+
+            gc.freeze()
+        gc.set_threshold(*GC_THRESHOLDS)
+
     def setup_custom_logger(self, path, debug):
         from octoprint.logging.handlers import CleaningTimedRotatingFileHandler
 
@@ -164,6 +268,34 @@ class EffectRunner:
                         line + "\n | - " + str(setting_key) + ": " + str(setting_value)
                     )
 
+        line = line + "\n | * TOOLHEAD *"
+        for key, value in self.settings["toolhead"].items():
+            line = line + "\n | - " + str(key) + ": " + str(value)
+
+        line = line + "\n | * EXTRA OUTPUTS *"
+        for output in self.settings["outputs"]:
+            line = line + "\n | - " + str(output)
+
+        line = line + "\n | * SEGMENTS *"
+        for segment in self.settings["segments"]:
+            line = line + "\n | - " + str(segment)
+
+        line = line + "\n | * MATRIX SETTINGS *"
+        for key, value in self.settings["matrix"].items():
+            line = line + "\n | - " + str(key) + ": " + str(value)
+
+        line = line + "\n | * PROCESS SETTINGS *"
+        for key, value in self.settings["process"].items():
+            line = line + "\n | - " + str(key) + ": " + str(value)
+
+        line = line + "\n | * EFFECT OPTIONS *"
+        for key, value in self.settings["effect_options"].items():
+            line = line + "\n | - " + str(key) + ": " + str(value)
+
+        line = line + "\n | * RUNNER SETTINGS *"
+        for key, value in self.settings["runner"].items():
+            line = line + "\n | - " + str(key) + ": " + str(value)
+
         # extras
         line = line + "\n | * ACTIVE TIMES *"
         line = line + "\n | - start: " + str(self.settings["active_start"])
@@ -172,18 +304,21 @@ class EffectRunner:
 
     def main_loop(self):
         try:
-            msg = self.previous_state
+            self.parse_q_msg(self.previous_state)
             while True:
-                if not self.queue.empty():
-                    msg = self.queue.get()  # The ONLY place the queue should be 'got'
-                if msg:
-                    parsed = self.parse_q_msg(msg)  # Effects are run from parse_q_msg
-                    if parsed == KILL_MSG:
-                        return
-                    elif parsed:
-                        msg = parsed  # So that previous state can return after 'lights on'
-                else:
-                    self.startup_effect()
+                try:
+                    # Wait for a message until the next frame is due
+                    msg = self.queue.get(  # The ONLY place the queue should be 'got'
+                        timeout=max(self.next_frame - time.time(), 0)
+                    )
+                except Empty:
+                    self.render_frame()
+                    continue
+                if self.parse_q_msg(msg) == KILL_MSG:
+                    return
+                if self.next_frame and time.time() >= self.next_frame:
+                    # Don't let a steady stream of messages (eg. M150s) hold up frames
+                    self.render_frame()
         except KeyboardInterrupt:
             self.blank_leds()
             return
@@ -191,112 +326,536 @@ class EffectRunner:
     def parse_q_msg(self, msg):
         if not msg:
             self.startup_effect()  # Will probably never happen, but just in case
-        if msg == KILL_MSG:
+        elif msg == KILL_MSG:
             self.blank_leds()
             self._logger.info("Kill message recieved, Bye!")
             return msg
         elif msg == "on":
             self.lights_on = True
             self._logger.info("On message recieved, turning on LEDs")
-            return self.previous_state
+            self.update_active()
         elif msg == "off":
             self.lights_on = False
             self._logger.info("Off message recieved, turning off LEDs")
-            return self.previous_state
+            self.update_active()
+        else:
+            self.set_mode(msg)
+
+    def set_mode(self, msg):
+        """
+        Route the message to a layer, on each segment that shows the mode:
+        * overlay: torch, M150 & toolhead. Torch stays until it is turned off, M150 until
+          the status changes, toolhead until it is turned off (torch & M150 cover it)
+        * progress: progress effects, cleared when the status changes
+        * base: all the other status effects
+        Effects underneath the overlay keep their place, and carry on when it is removed.
+        """
+        if isinstance(msg, M150):
+            self.show_m150(msg)
         elif "progress" in msg:
             msg_split = msg.split()
-            self.progress_effect(msg_split[0], float(msg_split[1]))
+            for segment in self.segments_showing(msg_split[0]):
+                self.progress_effect(segment, msg_split[0], float(msg_split[1]))
             if msg != self.previous_state:
                 self._logger.debug(
                     "Recieved message to update progress: {}".format(msg)
                 )
             self.previous_state = msg
-        elif "M150" in msg:
-            self.parse_m150(msg)
-            self.previous_state = msg
+        elif msg.startswith("toolhead "):
+            value = float(msg.split()[1])
+            for segment in self.segments_showing("toolhead"):
+                if segment.compositor.layer("overlay").mode in [None, "toolhead"]:
+                    self.toolhead_effect(segment, value)
+        elif msg == TOOLHEAD_OFF_MSG:
+            for segment in self.segments_showing("toolhead"):
+                if segment.compositor.layer("overlay").mode == "toolhead":
+                    self.clear_layer(segment, "overlay")
+        elif msg == TORCH_OFF_MSG:
+            self._logger.debug("Recieved message to turn torch off")
+            for segment in self.segments_showing("torch"):
+                if segment.compositor.layer("overlay").mode == "torch":
+                    self.clear_layer(segment, "overlay")
+        elif msg == "torch":
+            self._logger.debug("Recieved message to turn torch on")
+            for segment in self.segments_showing("torch"):
+                self.standard_effect(segment, "torch", "overlay")
         else:
-            self.standard_effect(msg)
-            if msg != self.previous_state:
+            changed = False
+            for segment in self.segments:
+                # Cleared everywhere, so segments that don't show the new status aren't
+                # left showing progress or colours from before it
+                self.clear_layer(segment, "progress")
+                if segment.compositor.layer("overlay").mode == "M150":
+                    self.clear_layer(segment, "overlay")
+            for segment in self.segments_showing(msg):
+                if msg != segment.compositor.layer("base").mode:
+                    # The same status again would just restart the effect, so is skipped
+                    self.standard_effect(segment, msg, "base")
+                    changed = True
+            if changed:
                 self._logger.debug("Recieved message to change effect: {}".format(msg))
             self.previous_state = msg
 
-    def parse_m150(self, msg):
-        red = (
-            green
-        ) = blue = 0  # Start at 0, means sending 'M150' with no params turns LEDs off
-        red_included = green_included = blue_included = False
-        brightness = self.max_brightness  # No 'P' param? Use set brightness
-        matches = re.finditer(M150_REGEX, msg)
-        for match in matches:
-            if match.group("red"):
-                red = min(int(match.group("red")), 255)
-                red_included = True
-            elif match.group("green"):
-                green = min(int(match.group("green")), 255)
-                green_included = True
-            elif match.group("blue"):
-                blue = min(int(match.group("blue")), 255)
-                blue_included = True
-            elif match.group("white"):
-                # See issue #33 for details of why this was changed. R/G/B params take priority over white, rather than
-                # the other way (w max priority). For compatibility with https://github.com/horfee/OctoPrint-M150control
-                if not red_included and not blue_included and not green_included:
-                    red = green = blue = min(int(match.group("white")), 255)
-            elif match.group("brightness"):
-                brightness = min(int(match.group("brightness")), 255)
-
-        if self.check_times() and self.lights_on:  # Respect lights on/off
-            EFFECTS["solid"](
-                self.strip, self.queue, (red, green, blue), max_brightness=brightness
+    def segments_showing(self, mode):
+        return (segment for segment in self.segments if segment.shows(mode))
+
+    def show_m150(self, m150):
+        """
+        Show an M150 command on the overlay, in the next frame. Commands arriving within
+        a frame interval of each other are shown together in the same frame, so a burst
+        of them setting single LEDs is one write to the strip. Only the latest colour of
+        the whole strip is drawn, the ones it replaces are dropped.
+        :param m150: gcode.M150, the colour sent in an M150 command
+        :return: None
+        """
+        self.m150_stats.add("received")
+        if m150.index is None and m150.strip is None:
+            # Covers everything the commands before it set
+            self.m150_stats.add("dropped", len(self.m150_pending))
+            del self.m150_pending[:]
+        self.m150_pending.append(m150)
+
+        for segment in self.segments_showing("M150"):
+            overlay = segment.compositor.layer("overlay")
+            if overlay.mode == "M150":
+                overlay.due = 0  # Copy the changes in the next frame
+                continue
+            # M150 is often used for quick changes, so cut straight to it rather than fading
+            segment.cancel_transition()
+            self.start_layer(
+                segment,
+                "overlay",
+                "M150",
+                basic.copy_frame,
+                (self.m150, segment.start, segment.reverse),
+                transition=False,
             )
+        due = time.time() + self.governor.frame_interval
+        self.next_frame = min(self.next_frame, due) if self.next_frame else due
+
+    def draw_m150(self):
+        """Draw the M150 commands received since the last frame into the M150 framebuffer"""
+        for m150 in self.m150_pending:
+            color = pack_rgb(m150.red, m150.green, m150.blue)
+            pixels = self.m150_pixels(m150)
+            if pixels is None:
+                basic.fill(self.m150, color)
+            else:
+                for n in pixels:
+                    self.m150.pixels[n] = color
+            self.m150.setBrightness(m150.brightness)
+        self.m150_stats.add("frames")
+        self.m150_stats.add("merged", len(self.m150_pending) - 1)
+        del self.m150_pending[:]
+
+    def m150_pixels(self, m150):
+        """
+        :param m150: gcode.M150
+        :return: list of the pixels an M150 command sets, None for all of them
+        """
+        if m150.strip is None:
+            if m150.index is None:
+                return None
+            start, count = 0, self.mapping.num_leds
+        elif m150.strip < len(self.strip.outputs):
+            output = self.strip.outputs[m150.strip]
+            start, count = output.start, output.count
         else:
-            self.blank_leds()
+            self._logger.warning(
+                "M150 for strip {}, but there are only {} outputs, ignoring it".format(
+                    m150.strip, len(self.strip.outputs)
+                )
+            )
+            return []
+
+        # LEDs are counted along the strip (or output) as they are wired, like Marlin
+        first, last = m150.index if m150.index is not None else (0, count - 1)
+        leds = self.mapping.index[start + first : start + min(last + 1, count)]
+        return [n for n in leds if n < self.mapping.num_pixels]  # Not skipped
+
+    def apply_process_settings(self):
+        """
+        Set the priority, CPU affinity & scheduling policy of the effect process.
+        Settings that can't be applied, eg. real-time scheduling without permission,
+        are logged and skipped.
+        :return: dict of the process state, for the stats
+        """
+        process_settings = self.settings["process"]
+        state = {"nice": 0, "cpus": None, "scheduler": "normal"}
+
+        if process_settings["nice"]:
+            try:
+                state["nice"] = os.nice(process_settings["nice"])
+            except OSError as e:
+                self._logger.error("Failed to set process priority: {}".format(e))
+
+        if process_settings["cpus"]:
+            try:
+                os.sched_setaffinity(0, process_settings["cpus"])
+            except (AttributeError, OSError, ValueError) as e:
+                self._logger.error("Failed to set CPU affinity: {}".format(e))
+        if hasattr(os, "sched_getaffinity"):
+            state["cpus"] = sorted(os.sched_getaffinity(0))
+
+        scheduler = process_settings["scheduler"]
+        if scheduler != "normal":
+            try:
+                os.sched_setscheduler(
+                    0,
+                    getattr(os, PROCESS_SCHEDULERS[scheduler]),
+                    os.sched_param(process_settings["rt_priority"]),
+                )
+                state["scheduler"] = scheduler
+            except (AttributeError, OSError) as e:
+                self._logger.error(
+                    "Failed to set real-time scheduling, OctoPrint may need the "
+                    "CAP_SYS_NICE capability: {}".format(e)
+                )
+        return state
 
     def startup_effect(self):
         if self.previous_state != "startup":
             self._logger.debug("Hello! Running startup effect")
-        self.standard_effect("startup")
-        self.previous_state = "startup"
-
-    def progress_effect(self, mode, value):
-        if self.check_times() and self.lights_on:
-            effect_settings = self.settings[mode]
-            EFFECTS[mode](
-                self.strip,
-                self.queue,
+        self.set_mode("startup")
+
+    def progress_effect(self, segment, mode, value):
+        effect_settings = self.settings[mode]
+        effect, args = self.effect_for(
+            segment,
+            mode,
+            (
                 int(value),
                 hex_to_rgb(effect_settings["color"]),
                 hex_to_rgb(effect_settings["base"]),
                 self.max_brightness,
-                self.reverse,
-            )
-        else:
-            self.blank_leds()
+            ),
+        )
+        self.start_layer(
+            segment,
+            "progress",
+            mode,
+            effect,
+            args,
+            # Only fade between different modes, not updates to the same one
+            transition=mode != segment.compositor.layer("progress").mode,
+        )
+
+    def toolhead_effect(self, segment, value):
+        effect_settings = self.settings["toolhead"]
+        effect, args = self.effect_for(
+            segment,
+            "toolhead",
+            (
+                value,
+                hex_to_rgb(effect_settings["color"]),
+                hex_to_rgb(effect_settings["base"]),
+                self.max_brightness,
+            ),
+        )
+        self.start_layer(
+            segment,
+            "overlay",
+            "toolhead",
+            effect,
+            args,
+            # Fade in, but follow the toolhead without fading
+            transition=segment.compositor.layer("overlay").mode != "toolhead",
+        )
 
-    def standard_effect(self, mode):
-        if self.check_times() and self.lights_on:
-            effect_settings = self.settings[mode]
-            EFFECTS[effect_settings["effect"]](
-                self.strip,
-                self.queue,
+    def standard_effect(self, segment, mode, layer_name):
+        effect_settings = self.settings[mode]
+        effect, args = self.effect_for(
+            segment,
+            effect_settings["effect"],
+            (
                 hex_to_rgb(effect_settings["color"]),
                 effect_settings["delay"],
                 self.max_brightness,
+            ),
+        )
+        self.start_layer(segment, layer_name, mode, effect, args)
+
+    def effect_for(self, segment, name, args):
+        """
+        Pick the effect to show on a segment, using the matrix version if there is one
+        and the segment covers whole rows of the matrix
+        :param segment: compositor.Segment the effect will be shown on
+        :param name: key of the effect in EFFECTS
+        :param args: tuple of arguments for the effect
+        :return: (effect, args)
+        """
+        if (
+            self.matrix_width
+            and name in MATRIX_EFFECTS
+            and segment.start % self.matrix_width == 0
+            and segment.length % self.matrix_width == 0
+        ):
+            return MATRIX_EFFECTS[name], args + (self.matrix_width,)
+        if name in self.settings["effect_options"]:
+            # Options only some effects have, eg. the number of bouncy balls
+            return partial(EFFECTS[name], **self.settings["effect_options"][name]), args
+        return EFFECTS[name], args
+
+    def start_layer(self, segment, name, mode, effect, args, transition=True):
+        """
+        Start a new effect on one of a segment's layers
+        :param segment: compositor.Segment to show the effect on
+        :param name: name of the layer, from LAYERS
+        :param mode: name of the mode being shown, for the layer to keep track of
+        :param effect: effect generator function, from EFFECTS
+        :param args: tuple of arguments to pass to the effect, after the framebuffer
+        :param transition: (bool) whether to fade into the new effect
+        :return: None
+        """
+        if transition and not segment.compositor.covered(name):
+            segment.start_transition(time.time())
+        frame = segment.compositor.layer(name).frame
+        segment.compositor.start_layer(name, mode, lambda: effect(frame, *args))
+        self.next_frame = 0
+
+    def clear_layer(self, segment, name):
+        layer = segment.compositor.layer(name)
+        if layer.active:
+            if not segment.compositor.covered(name):
+                segment.start_transition(time.time())
+            segment.compositor.clear_layer(name)
+            self.next_frame = 0
+
+    def create_mapping(self):
+        """
+        Work out where each pixel drawn by the effects goes on the strip
+        :return: mapping.PixelMapping
+        """
+        strip_settings = self.settings["strip"]
+        num_leds = self.strip.numPixels()
+
+        matrix_settings = self.settings["matrix"]
+        if self.matrix_width:
+            if matrix_settings["width"] * matrix_settings["height"] <= num_leds:
+                return PixelMapping(
+                    num_leds,
+                    matrix_order(
+                        matrix_settings["width"],
+                        matrix_settings["height"],
+                        serpentine=matrix_settings["serpentine"],
+                        origin=matrix_settings["origin"],
+                        vertical=matrix_settings["vertical"],
+                    ),
+                )
+            self._logger.error(
+                "Matrix of {}x{} is bigger than the strip of {} LEDs, using it as a strip".format(
+                    matrix_settings["width"], matrix_settings["height"], num_leds
+                )
             )
-        else:
-            self.blank_leds()
+            self.matrix_width = None
 
-    def blank_leds(self):
-        """Set LEDs to off, wait 0.1secs to prevent CPU burn"""
-        EFFECTS["solid"](
-            self.strip,
-            self.queue,
-            [0, 0, 0],
-            max_brightness=self.max_brightness,
-            wait=False,
+        skip = [led for led in strip_settings["led_skip"] if 0 <= led < num_leds]
+        if len(skip) != len(strip_settings["led_skip"]):
+            self._logger.warning(
+                "Some LEDs to skip are not on the strip of {} LEDs, ignoring them".format(
+                    num_leds
+                )
+            )
+        return PixelMapping(
+            num_leds,
+            strip_order(
+                num_leds,
+                reverse=strip_settings["reverse"],
+                offset=strip_settings["led_offset"] or 0,
+                skip=skip,
+                serpentine_width=strip_settings["serpentine_width"] or 0,
+            ),
+        )
+
+    def create_segments(self):
+        """
+        Split the strip up using the 'segments' setting. With none configured, a single
+        segment covers the whole strip and shows every mode.
+        :return: list of compositor.Segment
+        """
+        num_pixels = self.mapping.num_pixels
+        segments = []
+        for config in self.settings["segments"]:
+            start = config["start"]
+            length = config["length"]
+            if start < 0 or length <= 0 or start + length > num_pixels:
+                self._logger.warning(
+                    "Segment {} does not fit on the strip of {} LEDs, ignoring it".format(
+                        config, num_pixels
+                    )
+                )
+                continue
+            segments.append(
+                Segment(
+                    start,
+                    length,
+                    LAYERS,
+                    reverse=config["reverse"],
+                    modes=config["modes"],
+                    transition_duration=self.transition_duration,
+                )
+            )
+
+        if not segments:
+            segments.append(
+                Segment(
+                    0, num_pixels, LAYERS, transition_duration=self.transition_duration
+                )
+            )
+
+        overlay_opacity = int(
+            round(OPAQUE * self.settings["runner"]["overlay_opacity"] / 100)
+        )
+        for segment in segments:
+            segment.compositor.layer("overlay").opacity = overlay_opacity
+        return segments
+
+    def update_governor(self):
+        """Check the system load & temperature, and skip transitions if under pressure"""
+        if self.governor.update():
+            self._logger.debug(
+                "Frame rate governor changed to {state}, {fps}fps (load {load}, temperature {temperature})".format(
+                    **self.governor.report()
+                )
+            )
+            for segment in self.segments:
+                if self.governor.cheap:
+                    segment.transition_duration = 0
+                    segment.cancel_transition()
+                else:
+                    segment.transition_duration = self.transition_duration
+        self.governor_due = time.time() + GOVERNOR_INTERVAL
+
+    def update_active(self):
+        """Check the lights on/off switch & active times, fade to black if they have changed"""
+        active = self.lights_on and self.check_times()
+        if active != self.active:
+            now = time.time()
+            for segment in self.segments:
+                segment.start_transition(now)
+                segment.compositor.restack = True
+            self.active = active
+            self.next_frame = 0
+        self.active_check_due = time.time() + ACTIVE_CHECK_INTERVAL
+
+    def render_frame(self):
+        """
+        Advance the segments that are due, and send the frame to the strip.
+        Sets self.next_frame to when this should be called again.
+        :return: None
+        """
+        now = time.time()
+        if self.next_frame:  # Frames straight after a message aren't scheduled
+            self.frame_jitter.add(max(now - self.next_frame, 0))
+        if now >= self.active_check_due:
+            self.update_active()
+        if now >= self.governor_due:
+            self.update_governor()
+        if now >= self.stats_due:
+            self.report_stats(now)
+
+        if self.m150_pending:
+            self.draw_m150()
+
+        changed = self._changed
+        del changed[:]
+        next_frame = min(self.active_check_due, self.governor_due, self.stats_due)
+        for segment in self.segments:
+            if segment.render(now, self.active):
+                changed.append(segment)
+            next_frame = min(next_frame, segment.due)
+        self.next_frame = max(next_frame, now + self.governor.frame_interval)
+
+        if not changed:
+            return
+
+        segment = self.segments[0]
+        if len(self.segments) == 1 and segment.length == len(self.pixels):
+            if segment.changed is not None:
+                self.show_changes(segment.pixels, segment.brightness, segment.changed)
+            elif segment.reverse:
+                self.show(segment.pixels[::-1], segment.brightness)
+            else:
+                self.show(segment.pixels, segment.brightness)
+            return
+
+        # Put all the segments together, so there is still only one show() per frame
+        for segment in changed:
+            pixels = (
+                segment.pixels
+                if segment.brightness >= 255
+                else scale_pixels(segment.pixels, segment.brightness)
+            )
+            self.pixels[segment.start : segment.start + segment.length] = (
+                pixels[::-1] if segment.reverse else pixels
+            )
+        self.show(self.pixels)
+
+    def show_changes(self, pixels, brightness, changed):
+        """
+        Send only the changed pixels of the (single) segment to the strip
+        :param pixels: list of packed pixels, for the whole strip
+        :param brightness: int 0-255
+        :param changed: list of pixel indexes that have changed since the last frame
+        """
+        if brightness != self.shown_brightness:
+            # Brightness is set per output, so they all need to be written again
+            self.show(pixels[::-1] if self.segments[0].reverse else pixels, brightness)
+            return
+        if not changed:
+            return
+
+        start = time.time()
+        order = self.mapping.order
+        last = len(pixels) - 1
+        reverse = self.segments[0].reverse
+        for n in changed:
+            self.strip.set_led(order[last - n if reverse else n], pixels[n])
+        self.delta_write_time.add(time.time() - start)
+
+        start = time.time()
+        self.strip.show()
+        self.render_time.add(time.time() - start)
+
+    def show(self, pixels, brightness=255):
+        self.shown_brightness = brightness
+        pixels = self.mapping.apply(pixels)
+        for output in self.strip.outputs:
+            start = time.time()
+            output.write(pixels, brightness)
+            output.write_time.add(time.time() - start)
+        start = time.time()
+        self.strip.show()  # Renders all the outputs at once
+        self.render_time.add(time.time() - start)
+
+    def report_stats(self, now):
+        """Send the timing stats since the last report to the plugin"""
+        render = self.render_time.report()
+        self.stats_queue.put(
+            {
+                "fps": round(render["count"] / (now - self.stats_start), 1),
+                "render": render,
+                "governor": self.governor.report(),
+                "jitter": self.frame_jitter.report(),
+                "delta_write": self.delta_write_time.report(),
+                "m150": self.m150_stats.report(),
+                "process": self.process_state,
+                "outputs": [
+                    {
+                        "channel": output.index,
+                        "led_count": output.count,
+                        "write": output.write_time.report(),
+                    }
+                    for output in self.strip.outputs
+                ],
+            }
         )
-        if self.queue.empty():
-            time.sleep(0.1)
+        self.stats_start = now
+        self.stats_due = now + STATS_INTERVAL
+
+    def blank_leds(self):
+        """Set LEDs to off straight away, skipping the effects"""
+        self.show([0] * self.mapping.num_pixels)
 
     def check_times(self):
         """Check if current time is within 'active times' configuration, log if change detected"""
@@ -324,24 +883,42 @@ class EffectRunner:
 
     def start_strip(self):
         """
-        Start PixelStrip object
-        :returns rpi_ws281x.PixelStrip
+        Start the LED controller, with the strip & any extra outputs
+        :returns outputs.Controller
         """
         self._logger.info("Initialising LED strip")
         strip_settings = self.settings["strip"]
+        outputs_settings = [strip_settings]
+        for output_settings in self.settings["outputs"]:
+            # rpi_ws281x has two channels, each can drive one strip
+            if output_settings["led_channel"] not in [0, 1] or output_settings[
+                "led_channel"
+            ] in [settings["led_channel"] for settings in outputs_settings]:
+                self._logger.error(
+                    "Output {} needs a free PWM channel (0 or 1), ignoring it".format(
+                        output_settings
+                    )
+                )
+                continue
+            outputs_settings.append(
+                dict(output_settings, led_brightness=strip_settings["led_brightness"])
+            )
+
         try:
-            strip = PixelStrip(
-                num=strip_settings["led_count"],
-                pin=strip_settings["led_pin"],
+            strip = Controller(
+                [
+                    dict(settings, strip_type=STRIP_TYPES[settings["strip_type"]])
+                    for settings in outputs_settings
+                ],
                 freq_hz=strip_settings["led_freq_hz"],
                 dma=strip_settings["led_dma"],
-                invert=strip_settings["led_invert"],
-                brightness=strip_settings["led_brightness"],
-                channel=strip_settings["led_channel"],
-                strip_type=STRIP_TYPES[strip_settings["strip_type"]],
             )
             strip.begin()
-            self._logger.info("Strip successfully initialised")
+            self._logger.info(
+                "Strip successfully initialised, with {} output(s)".format(
+                    len(strip.outputs)
+                )
+            )
             return strip
         except Exception as e:  # Probably wrong settings...
             self._logger.error("Strip failed to initialize, no effects will be run.")
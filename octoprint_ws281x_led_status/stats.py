@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, unicode_literals
+
+
+class TimingStats(object):
+    """Collects durations between reports, for the runner's stats"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, secs):
+        self.count += 1
+        self.total += secs
+        if secs > self.max:
+            self.max = secs
+
+    def report(self):
+        """
+        Summarise the durations since the last report, then start again
+        :return: dict of count, average & max in ms
+        """
+        report = {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 3) if self.count else 0,
+            "max_ms": round(self.max * 1000, 3),
+        }
+        self.count = 0
+        self.total = self.max = 0.0
+        return report
+
+
+class CountStats(object):
+    """Counts events between reports, for the runner's stats"""
+
+    def __init__(self, *names):
+        self.names = names
+        self.counts = dict.fromkeys(names, 0)
+
+    def add(self, name, count=1):
+        self.counts[name] += count
+
+    def report(self):
+        """
+        :return: dict of the counts since the last report, then start again
+        """
+        report = self.counts
+        self.counts = dict.fromkeys(self.names, 0)
+        return report
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+# Filtering of the temperatures reported by the printer, before they are shown
+from __future__ import absolute_import, division, unicode_literals
+
+import math
+
+SMOOTHING = 0.5  # Weight of each new report in the moving average, 0-1
+HYSTERESIS = 2  # Percent progress has to go back by to change direction
+
+
+class ProgressFilter(object):
+    """
+    Smooths the heating & cooling progress worked out from temperature reports, so the
+    effect is only updated when there is a change to show. Firmware reports several
+    times a second while heating, mostly with the same progress, or noise either side.
+
+    Progress is smoothed with an exponential moving average, then only passed on when it
+    changes. It has to change by HYSTERESIS to turn around, so noise doesn't make it
+    flicker back and forth, and while heating it never goes back at all.
+    """
+
+    def __init__(self, smoothing=SMOOTHING, hysteresis=HYSTERESIS):
+        """
+        :param smoothing: weight of each new value in the moving average, 0-1. 1 for no
+            smoothing.
+        :param hysteresis: percent the progress has to go back by to change direction
+        """
+        self.smoothing = smoothing
+        self.hysteresis = hysteresis
+        self.received = 0  # Values given to update, since starting
+        self.emitted = 0  # Values passed on by update, since starting
+        self.heating = True
+        self._average = None
+        self._last = None  # Last progress passed on
+        self._direction = 1  # Which way progress last went, 1 for up or -1 for down
+
+    def reset(self, heating=True):
+        """
+        Start again, eg. when a heater starts heating
+        :param heating: (bool) heating up, so progress can only go up, or cooling down
+        """
+        self.heating = heating
+        self._average = self._last = None
+        self._direction = 1 if heating else -1
+
+    def update(self, progress):
+        """
+        :param progress: progress worked out from the latest temperature report
+        :return: int progress to show, or None if there is no change to show
+        """
+        self.received += 1
+        if self._average is None:
+            self._average = progress
+        else:
+            self._average += self.smoothing * (progress - self._average)
+        value = int(round(self._average))
+
+        last = self._last
+        if last is not None:
+            if value == last or (self.heating and value < last):
+                return None
+            direction = 1 if value > last else -1
+            if direction != self._direction and abs(value - last) < self.hysteresis:
+                return None
+            self._direction = direction
+
+        self._last = value
+        self.emitted += 1
+        return value
+
+    def report(self):
+        """
+        :return: dict of the number of values received & emitted, for the API
+        """
+        return {"received": self.received, "emitted": self.emitted}
+
+
+class HeatingModel(object):
+    """
+    Predicts how long a heater has left to reach its target, for showing heating
+    progress by time rather than temperature. Heaters slow down as they get hotter, so
+    progress by temperature races most of the way then crawls.
+
+    A heater warms up as Newton's law of heating, where the rate it heats at falls in a
+    straight line as it gets closer to the target: rate = a + b * (target - temperature).
+    The rate is measured over the last WINDOW temperature reports, held in a ring buffer,
+    and a & b fitted to it with recursive least squares, so each report is a handful of
+    arithmetic rather than a refit of the history. Older measurements are forgotten, so
+    the fit follows the heater as it slows down.
+    """
+
+    WINDOW = 8  # Reports the rate of heating is measured over
+    FORGETTING = 0.98  # Weight kept by older measurements in the fit, for each new one
+    MIN_MEASUREMENTS = 3  # Before the fit is used
+
+    def __init__(self):
+        self.times = [0.0] * self.WINDOW
+        self.temperatures = [0.0] * self.WINDOW
+        self.remaining = None  # secs, latest prediction
+        self.reset(0.0, 0.0)
+
+    def reset(self, now, target):
+        """
+        Start again, when a heater starts heating
+        :param now: time.time() heating started
+        :param target: temperature the heater is heating to
+        """
+        self.start = now
+        self.target = target
+        self.remaining = None
+        self._count = 0  # Reports added
+        self._measurements = 0  # Rates fitted
+        # Fitted a & b (see class docstring), and the fit's covariance matrix
+        self._a = self._b = 0.0
+        self._p00, self._p01, self._p11 = 1000.0, 0.0, 1000.0
+
+    def add(self, now, temperature, target):
+        """
+        :param now: time.time() of the report
+        :param temperature: current temperature of the heater
+        :param target: temperature the heater is heating to
+        :return: secs until the target is reached, or None if it can't be predicted yet
+        """
+        if target != self.target:  # Fitted to the old target, start again
+            self.reset(self.start, target)
+        slot = self._count % self.WINDOW
+        oldest = slot if self._count >= self.WINDOW else 0  # Before it is replaced
+        start_time, start_temperature = self.times[oldest], self.temperatures[oldest]
+        self.times[slot] = now
+        self.temperatures[slot] = temperature
+        self._count += 1
+        elapsed = now - start_time
+        if self._count == 1 or elapsed <= 0:  # First report, or repeated
+            return self.remaining
+
+        # Rate of heating over the window, at the distance to go in the middle of it
+        rate = (temperature - start_temperature) / elapsed
+        x = self.target - (temperature + start_temperature) / 2
+        self._fit(x, rate)
+
+        to_go = self.target - temperature
+        if to_go <= 0:
+            self.remaining = 0.0
+        elif self._measurements >= self.MIN_MEASUREMENTS and self._a > 0:
+            # Time for the exponential approach to cover the distance to go
+            if self._b > 1e-6:
+                self.remaining = math.log1p(self._b * to_go / self._a) / self._b
+            else:  # Heating in a straight line
+                self.remaining = to_go / self._a
+        elif rate > 0:
+            self.remaining = to_go / rate
+        else:
+            self.remaining = None
+        return self.remaining
+
+    def _fit(self, x, rate):
+        """Recursive least squares update, for rate = a + b * x"""
+        p00, p01, p11 = self._p00, self._p01, self._p11
+        forgetting = self.FORGETTING
+        # Gain, from the covariance times the regressor [1, x]
+        g0 = p00 + p01 * x
+        g1 = p01 + p11 * x
+        denominator = forgetting + g0 + g1 * x
+        k0 = g0 / denominator
+        k1 = g1 / denominator
+        error = rate - (self._a + self._b * x)
+        self._a += k0 * error
+        self._b += k1 * error
+        self._p00 = (p00 - k0 * g0) / forgetting
+        self._p01 = (p01 - k0 * g1) / forgetting
+        self._p11 = (p11 - k1 * g1) / forgetting
+        self._measurements += 1
+
+    def progress(self, now):
+        """
+        :param now: time.time()
+        :return: percent of the heating time gone, or None if it can't be predicted yet
+        """
+        if self.remaining is None:
+            return None
+        elapsed = now - self.start
+        total = elapsed + self.remaining
+        if total <= 0:
+            return 100
+        return elapsed / total * 100
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, unicode_literals
+
+import pytest
+
+from octoprint_ws281x_led_status.effects import basic
+from octoprint_ws281x_led_status.framebuffer import FrameBuffer
+
+tracemalloc = pytest.importorskip("tracemalloc")  # Python 3 only
+
+NUM_PIXELS = 30
+WARM_UP_FRAMES = 200
+FRAMES = 2000
+MAX_GROWTH = 1024  # bytes, over all the frames - ie. none per frame
+
+BASIC_EFFECTS = [
+    basic.solid_color,
+    basic.color_wipe,
+    basic.color_wipe_2,
+    basic.simple_pulse,
+    basic.rainbow,
+    basic.rainbow_cycle,
+    basic.solo_bounce,
+    basic.bounce,
+    basic.random_single,
+    basic.blink,
+    basic.crossover,
+    basic.bouncy_balls,
+]
+
+
+def frames(effect, strip):
+    """Step an effect frame by frame, starting it again when it finishes a cycle, as
+    compositor.Layer does"""
+    while True:
+        for delay in effect(strip, (255, 128, 0), 1, 255):
+            yield delay
+
+
+@pytest.mark.parametrize("effect", BASIC_EFFECTS, ids=lambda effect: effect.__name__)
+def test_no_allocations_per_frame(effect):
+    strip = FrameBuffer(NUM_PIXELS)
+    steps = frames(effect, strip)
+    for _ in range(WARM_UP_FRAMES):
+        next(steps)
+
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        for _ in range(FRAMES):
+            next(steps)
+        growth = tracemalloc.get_traced_memory()[0] - start
+    finally:
+        tracemalloc.stop()
+    assert growth <= MAX_GROWTH
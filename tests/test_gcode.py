@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, unicode_literals
+
+import random
+import re
+import timeit
+
+from octoprint_ws281x_led_status.gcode import parse_m150
+
+COMMANDS = 100000
+BRIGHTNESS = 128
+
+# The regex M150 commands were parsed with before gcode.parse_m150, kept as the
+# reference for how they should be read. It doesn't know about I & S.
+M150_REGEX = (
+    r"(^|[^A-Za-z])[Rr](?P<red>\d{1,3})|(^|[^A-Za-z])[GgUu](?P<green>\d{1,3})|(^|[^A-Za-z])"
+    r"[Bb](?P<blue>\d{1,3})|(^|[^A-Za-z])[Pp](?P<brightness>\d{1,3})|(^|[^A-Za-z])[Ww](?P<white>\d{1,3})"
+)
+
+
+def parse_m150_regex(command, brightness=255):
+    """The old parser, from runner.py. :return: (red, green, blue, brightness)"""
+    red = green = blue = 0
+    red_included = green_included = blue_included = False
+    for match in re.finditer(M150_REGEX, command):
+        if match.group("red"):
+            red = min(int(match.group("red")), 255)
+            red_included = True
+        elif match.group("green"):
+            green = min(int(match.group("green")), 255)
+            green_included = True
+        elif match.group("blue"):
+            blue = min(int(match.group("blue")), 255)
+            blue_included = True
+        elif match.group("white"):
+            if not red_included and not blue_included and not green_included:
+                red = green = blue = min(int(match.group("white")), 255)
+        elif match.group("brightness"):
+            brightness = min(int(match.group("brightness")), 255)
+    return red, green, blue, brightness
+
+
+def generate_commands(count, seed=150):
+    """
+    Half realistic commands, eg. 'M150 R10 U200', half random strings of parameter
+    letters, digits & separators. No I or S, which the regex doesn't read as parameters.
+    """
+    rng = random.Random(seed)
+    characters = "RGBUWPrgbuwpMX0123456789  ;.,-_\t"
+    commands = []
+    for _ in range(count):
+        if rng.random() < 0.5:
+            parameters = [
+                "{}{}".format(rng.choice("RUGBWP"), rng.randint(0, 400))
+                for _ in range(rng.randint(0, 5))
+            ]
+            separator = rng.choice([" ", "  ", ""]) if rng.random() < 0.2 else " "
+            commands.append(separator.join(["M150"] + parameters))
+        else:
+            commands.append(
+                "".join(rng.choice(characters) for _ in range(rng.randint(0, 30)))
+            )
+    return commands
+
+
+def test_parse_m150_matches_regex():
+    mismatches = []
+    for command in generate_commands(COMMANDS):
+        m150 = parse_m150(command, BRIGHTNESS)
+        parsed = (m150.red, m150.green, m150.blue, m150.brightness)
+        if parsed != parse_m150_regex(command, BRIGHTNESS):
+            mismatches.append(command)
+    assert not mismatches, mismatches[:10]
+
+
+def test_parse_m150_faster_than_regex():
+    commands = generate_commands(COMMANDS // 10)
+
+    def best_time(parse):
+        return min(
+            timeit.repeat(
+                lambda: [parse(command) for command in commands], number=1, repeat=3
+            )
+        )
+
+    # Twice as fast when written, so this leaves plenty of room for noise
+    assert best_time(parse_m150) < best_time(parse_m150_regex)